@@ -0,0 +1,279 @@
+import argparse
+import hashlib
+import io
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import pandas as pd
+
+# Fix Windows stdout encoding issue
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+# Snowflake credentials
+SNOWFLAKE_ACCOUNT = os.getenv('SNOWFLAKE_ACCOUNT')
+SNOWFLAKE_USER = os.getenv('SNOWFLAKE_USER')
+SNOWFLAKE_PASSWORD = os.getenv('SNOWFLAKE_PASSWORD')
+SNOWFLAKE_WAREHOUSE = os.getenv('SNOWFLAKE_WAREHOUSE')
+SNOWFLAKE_DATABASE = os.getenv('SNOWFLAKE_DATABASE', 'CREDITCARD')
+SNOWFLAKE_SCHEMA = os.getenv('SNOWFLAKE_SCHEMA', 'PUBLIC')
+
+# Schema of the credit card transaction files
+EXPECTED_COLUMNS = ['Time'] + [f'V{i}' for i in range(1, 29)] + ['Amount', 'Class']
+LEDGER_TABLE = 'INGEST_LEDGER'
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def validate_chunk(df, first_row):
+    """Check columns and values of a CSV chunk with whole-column operations; returns it with warehouse column names."""
+    if [c.upper() for c in df.columns] != [c.upper() for c in EXPECTED_COLUMNS]:
+        raise ValueError(f"Unexpected columns {list(df.columns)}; expected {EXPECTED_COLUMNS}")
+    df.columns = [c.upper() for c in EXPECTED_COLUMNS]
+
+    numeric = df.apply(pd.to_numeric, errors='coerce')
+    errors = []
+    bad_values = numeric.isna().sum()
+    for column, count in bad_values[bad_values > 0].items():
+        errors.append(f"{column}: {count} missing or non-numeric values")
+    if not numeric['CLASS'].isin([0, 1]).all():
+        errors.append("CLASS: values other than 0/1")
+    if (numeric['TIME'] < 0).any():
+        errors.append("TIME: negative values")
+    if (numeric['AMOUNT'] < 0).any():
+        errors.append("AMOUNT: negative values")
+    if errors:
+        raise ValueError(f"Rows {first_row}-{first_row + len(df) - 1} failed schema checks: " + '; '.join(errors))
+
+    numeric['CLASS'] = numeric['CLASS'].astype('int64')
+    return numeric
+
+
+def split_to_parquet(csv_path, out_dir, source_hash, chunk_rows, workers):
+    """Stream the CSV in chunks, validate each one and write it as a zstd-compressed Parquet file."""
+    def write_chunk(index, chunk):
+        file_name = f"{source_hash[:16]}_{index:05d}.parquet"
+        chunk.to_parquet(os.path.join(out_dir, file_name), compression='zstd', index=False)
+        return file_name, len(chunk)
+
+    futures = []
+    first_row = 0
+    # Parquet encoding releases the GIL, so chunks compress while the next one is parsed
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for index, chunk in enumerate(pd.read_csv(csv_path, chunksize=chunk_rows)):
+            chunk = validate_chunk(chunk, first_row)
+            first_row += len(chunk)
+            futures.append(pool.submit(write_chunk, index, chunk))
+        return [f.result() for f in futures]
+
+
+class SnowflakeBackend:
+    """Stage chunks in the user stage and load them with one COPY INTO."""
+
+    def __init__(self, table):
+        import snowflake.connector
+        self.conn = snowflake.connector.connect(
+            user=SNOWFLAKE_USER,
+            password=SNOWFLAKE_PASSWORD,
+            account=SNOWFLAKE_ACCOUNT,
+            warehouse=SNOWFLAKE_WAREHOUSE,
+            database=SNOWFLAKE_DATABASE,
+            schema=SNOWFLAKE_SCHEMA
+        )
+        self.table = table
+        self.conn.cursor().execute(f"""
+            CREATE TABLE IF NOT EXISTS {LEDGER_TABLE} (
+                TABLE_NAME VARCHAR, SOURCE_HASH VARCHAR, ROWS_LOADED NUMBER, LOADED_AT TIMESTAMP_NTZ
+            )
+        """)
+
+    def already_loaded(self, source_hash):
+        cur = self.conn.cursor()
+        cur.execute(f"SELECT COUNT(*) FROM {LEDGER_TABLE} WHERE TABLE_NAME = %s AND SOURCE_HASH = %s",
+                    (self.table, source_hash))
+        return cur.fetchone()[0] > 0
+
+    def stage_path(self, source_hash):
+        return f"@~/ingest/{self.table}/{source_hash[:16]}"
+
+    def put(self, local_path, source_hash):
+        # Files are already compressed Parquet; each PUT runs on its own cursor in a worker thread
+        self.conn.cursor().execute(
+            f"PUT file://{os.path.abspath(local_path)} {self.stage_path(source_hash)} AUTO_COMPRESS = FALSE OVERWRITE = TRUE"
+        )
+
+    def _create_table(self, cur, name):
+        columns = ', '.join(f"{c.upper()} {'NUMBER(1,0)' if c == 'Class' else 'FLOAT'}" for c in EXPECTED_COLUMNS)
+        cur.execute(f"CREATE TABLE IF NOT EXISTS {name} ({columns})")
+
+    def copy(self, file_names, source_hash, rows, mode):
+        files = ', '.join(f"'{name}'" for name in file_names)
+        copy_sql = """
+            COPY INTO {target}
+            FROM {stage}
+            FILES = ({files})
+            FILE_FORMAT = (TYPE = 'PARQUET')
+            MATCH_BY_COLUMN_NAME = CASE_INSENSITIVE
+        """
+        ledger_sql = f"INSERT INTO {LEDGER_TABLE} VALUES (%s, %s, %s, CURRENT_TIMESTAMP())"
+        cur = self.conn.cursor()
+        try:
+            # First-ever load: give the target its schema so LIKE / COPY have a table to work with
+            self._create_table(cur, self.table)
+            if mode == 'replace':
+                # Load beside the live table, then swap it in with one atomic metadata operation.
+                # DDL autocommits in Snowflake, so the swap can't share a transaction with the ledger:
+                # the ledger is updated in its own transaction right after.
+                staging = f"{self.table}_INGEST_STAGING"
+                cur.execute(f"CREATE OR REPLACE TABLE {staging} LIKE {self.table}")
+                cur.execute(copy_sql.format(target=staging, stage=self.stage_path(source_hash), files=files))
+                cur.execute(f"ALTER TABLE {self.table} SWAP WITH {staging}")
+                cur.execute(f"DROP TABLE IF EXISTS {staging}")
+                cur.execute("BEGIN")
+                cur.execute(f"DELETE FROM {LEDGER_TABLE} WHERE TABLE_NAME = %s", (self.table,))
+                cur.execute(ledger_sql, (self.table, source_hash, rows))
+                cur.execute("COMMIT")
+            else:
+                # COPY and ledger entry commit together, so a retry never double-loads
+                cur.execute("BEGIN")
+                cur.execute(copy_sql.format(target=self.table, stage=self.stage_path(source_hash), files=files))
+                cur.execute(ledger_sql, (self.table, source_hash, rows))
+                cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+        finally:
+            cur.execute(f"REMOVE {self.stage_path(source_hash)}")
+
+    def close(self):
+        self.conn.close()
+
+
+class LocalBackend:
+    """Local stand-in for Snowflake: a directory as the stage and a SQLite file as the warehouse."""
+
+    def __init__(self, table, root):
+        self.table = table
+        self.stage_root = os.path.join(root, 'stage', table)
+        os.makedirs(self.stage_root, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(root, 'warehouse.db'), isolation_level=None)
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {LEDGER_TABLE} (
+                TABLE_NAME TEXT, SOURCE_HASH TEXT, ROWS_LOADED INTEGER, LOADED_AT TEXT
+            )
+        """)
+
+    def already_loaded(self, source_hash):
+        row = self.conn.execute(f"SELECT COUNT(*) FROM {LEDGER_TABLE} WHERE TABLE_NAME = ? AND SOURCE_HASH = ?",
+                                (self.table, source_hash)).fetchone()
+        return row[0] > 0
+
+    def stage_path(self, source_hash):
+        return os.path.join(self.stage_root, source_hash[:16])
+
+    def put(self, local_path, source_hash):
+        os.makedirs(self.stage_path(source_hash), exist_ok=True)
+        shutil.copy(local_path, self.stage_path(source_hash))
+
+    def _create_table(self, name):
+        columns = ', '.join(f"{c.upper()} {'INTEGER' if c == 'Class' else 'REAL'}" for c in EXPECTED_COLUMNS)
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS {name} ({columns})")
+
+    def copy(self, file_names, source_hash, rows, mode):
+        placeholders = ', '.join(['?'] * len(EXPECTED_COLUMNS))
+        target = f"{self.table}_INGEST_STAGING" if mode == 'replace' else self.table
+        cur = self.conn.cursor()
+        try:
+            # SQLite DDL is transactional, so the whole replace commits or rolls back as one
+            cur.execute("BEGIN")
+            self._create_table(self.table)
+            if mode == 'replace':
+                cur.execute(f"DROP TABLE IF EXISTS {target}")
+                self._create_table(target)
+            for name in file_names:
+                df = pd.read_parquet(os.path.join(self.stage_path(source_hash), name))
+                cur.executemany(f"INSERT INTO {target} VALUES ({placeholders})", df.itertuples(index=False))
+            if mode == 'replace':
+                cur.execute(f"DROP TABLE {self.table}")
+                cur.execute(f"ALTER TABLE {target} RENAME TO {self.table}")
+                cur.execute(f"DELETE FROM {LEDGER_TABLE} WHERE TABLE_NAME = ?", (self.table,))
+            cur.execute(f"INSERT INTO {LEDGER_TABLE} VALUES (?, ?, ?, ?)",
+                        (self.table, source_hash, rows, datetime.now(timezone.utc).isoformat()))
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+        finally:
+            shutil.rmtree(self.stage_path(source_hash), ignore_errors=True)
+
+    def close(self):
+        self.conn.close()
+
+
+def ingest(csv_path, backend, mode, chunk_rows, workers):
+    source_bytes = os.path.getsize(csv_path)
+    start = time.perf_counter()
+    source_hash = file_sha256(csv_path)
+
+    if mode == 'append' and backend.already_loaded(source_hash):
+        print(f"⏭️ {os.path.basename(csv_path)} (sha256 {source_hash[:16]}) already loaded into {backend.table}. Nothing to do.")
+        return
+
+    with tempfile.TemporaryDirectory() as chunk_dir:
+        print(f"✂️ Splitting {os.path.basename(csv_path)} into Parquet chunks of {chunk_rows} rows...")
+        chunks = split_to_parquet(csv_path, chunk_dir, source_hash, chunk_rows, workers)
+        split_done = time.perf_counter()
+        rows = sum(n for _, n in chunks)
+        parquet_bytes = sum(os.path.getsize(os.path.join(chunk_dir, name)) for name, _ in chunks)
+        print(f"✅ {rows} rows validated into {len(chunks)} chunks "
+              f"({source_bytes / 1e6:.1f} MB CSV -> {parquet_bytes / 1e6:.1f} MB Parquet).")
+
+        print(f"📤 Uploading {len(chunks)} chunks with {workers} parallel workers...")
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda c: backend.put(os.path.join(chunk_dir, c[0]), source_hash), chunks))
+        upload_done = time.perf_counter()
+
+    print(f"📥 Loading chunks into {backend.table} ({mode})...")
+    backend.copy([name for name, _ in chunks], source_hash, rows, mode)
+    done = time.perf_counter()
+
+    elapsed = done - start
+    print(f"✅ Ingested {rows} rows into {backend.table} in {elapsed:.2f}s "
+          f"(split {split_done - start:.2f}s, upload {upload_done - split_done:.2f}s, load {done - upload_done:.2f}s).")
+    print(f"⏱️ Throughput: {source_bytes / 1e6 / elapsed:.1f} MB/s of source CSV")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Validate a credit card CSV, split it into Parquet chunks and load it into Snowflake."
+    )
+    parser.add_argument('csv_path', help="CSV with columns Time, V1..V28, Amount, Class")
+    parser.add_argument('--table', default='CREDITCARD', help="Target table (default: CREDITCARD)")
+    parser.add_argument('--mode', choices=['append', 'replace'], default='append',
+                        help="append skips files already loaded; replace atomically swaps the table contents")
+    parser.add_argument('--chunk-rows', type=int, default=250_000, help="Rows per Parquet chunk")
+    parser.add_argument('--workers', type=int, default=4, help="Parallel encode/upload workers")
+    parser.add_argument('--local', metavar='DIR',
+                        help="Load into a local SQLite stand-in under DIR instead of Snowflake")
+    args = parser.parse_args()
+
+    backend = LocalBackend(args.table, args.local) if args.local else SnowflakeBackend(args.table)
+    try:
+        ingest(args.csv_path, backend, args.mode, args.chunk_rows, args.workers)
+    finally:
+        backend.close()
+        print("🔒 Connection closed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import json
+import os
+import time
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+PREFILTER_MODEL_PATH = "prefilter_model.pkl"
+CASCADE_CONFIG_PATH = "cascade.json"
+
+
+def fit_prefilter(X, y, sample_weight=None):
+    """Cheap first stage: a handful of shallow trees that only need to rank fraud above non-fraud."""
+    prefilter = RandomForestClassifier(n_estimators=10, max_depth=6, random_state=42)
+    prefilter.fit(X, y, sample_weight=sample_weight)
+    return prefilter
+
+
+def calibrate_threshold(prefilter_scores, y_true, champion_preds, max_recall_loss):
+    """Largest pre-filter threshold whose dropped champion true positives cost at most max_recall_loss recall."""
+    y_true = np.asarray(y_true)
+    champion_tp_scores = np.sort(np.asarray(prefilter_scores)[(y_true == 1) & (np.asarray(champion_preds) == 1)])
+    n_positives = int((y_true == 1).sum())
+    if len(champion_tp_scores) == 0 or n_positives == 0:
+        return 0.0
+    # Rows scoring below the threshold are never escalated, so we may drop this many true positives
+    allowed_drops = int(np.floor(max_recall_loss * n_positives))
+    return float(champion_tp_scores[min(allowed_drops, len(champion_tp_scores) - 1)])
+
+
+def cascade_predict(prefilter, champion, X, threshold):
+    """Score X with the pre-filter and escalate rows at or above threshold to the champion.
+
+    Returns (predictions, probabilities, escalated mask). Rows that are not
+    escalated get a 0 prediction and keep the pre-filter probability,
+    capped just below 0.5: the threshold can exceed 0.5, and a
+    PREDICTION=0 row must never look like an alert downstream.
+    """
+    probs = prefilter.predict_proba(X)[:, 1]
+    escalated = probs >= threshold
+    probs = np.minimum(probs, np.nextafter(0.5, 0))
+    preds = np.zeros(len(probs), dtype=np.int64)
+    if escalated.any():
+        # One forest pass: for a binary forest predict() is argmax of predict_proba()
+        champion_probs = champion.predict_proba(X[escalated])
+        preds[escalated] = champion.classes_[champion_probs.argmax(axis=1)]
+        probs[escalated] = champion_probs[:, 1]
+    return preds, probs, escalated
+
+
+def evaluate_cascade(prefilter, champion, X, y, threshold):
+    """Holdout recall loss, escalation rate and throughput gain of the cascade over the champion alone."""
+    start = time.perf_counter()
+    champion_preds = champion.predict(X)
+    champion.predict_proba(X)
+    champion_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cascade_preds, _, escalated = cascade_predict(prefilter, champion, X, threshold)
+    cascade_time = time.perf_counter() - start
+
+    y = np.asarray(y)
+    n_positives = max(int((y == 1).sum()), 1)
+    champion_recall = ((champion_preds == 1) & (y == 1)).sum() / n_positives
+    cascade_recall = ((cascade_preds == 1) & (y == 1)).sum() / n_positives
+    return {
+        'Cascade Threshold': threshold,
+        'Cascade Escalation Rate': float(escalated.mean()),
+        'Cascade Recall Loss': float(champion_recall - cascade_recall),
+        'Cascade Throughput Gain': champion_time / cascade_time,
+    }
+
+
+def save_cascade_config(config, path=CASCADE_CONFIG_PATH):
+    with open(path, "w") as f:
+        json.dump(config, f, indent=4)
+
+
+def load_cascade_config(path=CASCADE_CONFIG_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+# Where each stage keeps <stage>_fingerprint.json next to its outputs
+FINGERPRINT_DIR = os.getenv("FINGERPRINT_DIR", ".")
+# Run every stage even when its inputs are unchanged
+FORCE_RERUN = os.getenv("FORCE_RERUN", "0") == "1"
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def file_fingerprints(paths):
+    """sha256 per path; missing files map to None."""
+    return {path: file_sha256(path) if os.path.exists(path) else None for path in paths}
+
+
+def table_fingerprints(conn, tables):
+    """Row count and HASH_AGG(*) per table, computed in the warehouse so no rows are transferred."""
+    cur = conn.cursor()
+    fingerprints = {}
+    for table in tables:
+        rows, hash_agg = cur.execute(f"SELECT COUNT(*), HASH_AGG(*) FROM {table}").fetchone()
+        fingerprints[table] = {"rows": int(rows), "hash_agg": None if hash_agg is None else str(hash_agg)}
+    return fingerprints
+
+
+def inputs_digest(inputs):
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class StageFingerprint:
+    """Decide whether a pipeline stage can be skipped because its inputs and outputs are unchanged.
+
+    The manifest records the digest of the stage's inputs (table
+    fingerprints, model hashes, config), the sha256 of each output file and
+    any extra output state (e.g. a result table's fingerprint), plus how
+    long the last real run took so skips can report the compute saved.
+    """
+
+    def __init__(self, stage, inputs, output_files=(), directory=FINGERPRINT_DIR):
+        self.stage = stage
+        self.inputs = inputs
+        self.output_files = list(output_files)
+        self.digest = inputs_digest(inputs)
+        self.path = os.path.join(directory, f"{stage}_fingerprint.json")
+        self.previous = None
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                self.previous = json.load(f)
+        self._start = time.perf_counter()
+
+    def unchanged(self, output_state=None, force=FORCE_RERUN):
+        """True when the last recorded run had the same inputs and its outputs are still intact."""
+        if force:
+            print(f"🔁 FORCE_RERUN set; running {self.stage} regardless of fingerprint.")
+            return False
+        if self.previous is None or self.previous.get("digest") != self.digest:
+            return False
+        if self.previous.get("output_files") != file_fingerprints(self.output_files):
+            print(f"ℹ️ {self.stage} inputs unchanged but outputs are missing or modified; rerunning.")
+            return False
+        if output_state is not None and self.previous.get("output_state") != output_state:
+            print(f"ℹ️ {self.stage} inputs unchanged but output state differs; rerunning.")
+            return False
+        return True
+
+    def skip(self):
+        """Record and report a skipped run; returns the compute seconds saved."""
+        saved = self.previous.get("compute_seconds", 0.0)
+        self.previous["skips"] = self.previous.get("skips", 0) + 1
+        self.previous["skipped_seconds_total"] = self.previous.get("skipped_seconds_total", 0.0) + saved
+        self.previous["last_skipped_at"] = datetime.now(timezone.utc).isoformat()
+        self._write(self.previous)
+        print(f"⏭️ {self.stage}: inputs unchanged since {self.previous['recorded_at']} (digest {self.digest[:12]}); "
+              f"skipped ~{saved:.1f}s of compute ({self.previous['skipped_seconds_total']:.1f}s over "
+              f"{self.previous['skips']} skips).")
+        write_github_output(skipped=True)
+        return saved
+
+    def record(self, output_state=None):
+        """Store the fingerprint after a real run, timing it from construction."""
+        compute_seconds = time.perf_counter() - self._start
+        previous = self.previous or {}
+        self._write({
+            "stage": self.stage,
+            "digest": self.digest,
+            "inputs": self.inputs,
+            "output_files": file_fingerprints(self.output_files),
+            "output_state": output_state,
+            "compute_seconds": compute_seconds,
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+            "skips": previous.get("skips", 0),
+            "skipped_seconds_total": previous.get("skipped_seconds_total", 0.0),
+        })
+        print(f"🧬 {self.stage} fingerprint {self.digest[:12]} saved to {self.path} ({compute_seconds:.1f}s of compute).")
+        write_github_output(skipped=False)
+
+    def _write(self, manifest):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=4, default=str)
+        os.replace(tmp_path, self.path)
+
+
+def write_github_output(**values):
+    """Expose values as step outputs when running under GitHub Actions."""
+    path = os.environ.get("GITHUB_OUTPUT")
+    if not path:
+        return
+    with open(path, "a") as f:
+        for key, value in values.items():
+            f.write(f"{key}={str(value).lower()}\n")
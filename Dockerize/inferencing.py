@@ -4,6 +4,12 @@ import snowflake.connector
 import joblib  # ✅ Use joblib or pickle to load the local .pkl model
 import sys
 import io
+import time
+import json
+from cascade import cascade_predict, load_cascade_config
+from prediction_log import PredictionLogWriter
+from reason_codes import add_reason_codes, REASON_CODE_ALERT_THRESHOLD, REASON_CODE_TOP_K
+from fingerprint import StageFingerprint, table_fingerprints, file_fingerprints
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -24,6 +30,18 @@ SNOWFLAKE_SCHEMA = os.getenv('SNOWFLAKE_SCHEMA')
 BATCH_INPUT_TABLE = f"{SNOWFLAKE_DATABASE}.{SNOWFLAKE_SCHEMA}.CREDITCARD_BATCH_INPUTS"
 BATCH_PREDICTIONS_TABLE = f"{SNOWFLAKE_DATABASE}.{SNOWFLAKE_SCHEMA}.BATCH_PREDICTIONS"
 
+# Two-stage cascade scoring (set INFERENCE_CASCADE=1); uses the pre-filter exported with the champion
+INFERENCE_CASCADE = os.getenv('INFERENCE_CASCADE', '0') == '1'
+CHAMPION_PREFILTER_PATH = "champion_prefilter.pkl"
+CHAMPION_CASCADE_CONFIG_PATH = "champion_cascade.json"
+CHAMPION_METADATA_PATH = "champion_model.json"
+
+# Top-k contributing features for rows above the alert threshold (REASON_CODES=0 disables)
+REASON_CODES_ENABLED = os.getenv('REASON_CODES', '1') == '1'
+
+# Also append scored rows to the columnar prediction log when set
+PREDICTION_LOG_DIR = os.getenv('PREDICTION_LOG_DIR')
+
 def get_snowflake_connection():
     return snowflake.connector.connect(
         user=SNOWFLAKE_USER,
@@ -50,7 +68,23 @@ def get_champion_model():
     model = joblib.load(model_path)
     return model
 
-def generate_predictions(df, model):
+def get_champion_version():
+    if not os.path.exists(CHAMPION_METADATA_PATH):
+        return "unknown"
+    with open(CHAMPION_METADATA_PATH, "r") as f:
+        return str(json.load(f).get("version", "unknown"))
+
+def get_cascade_prefilter():
+    """Return (prefilter, config) when the champion was exported with a cascade, else None."""
+    config = load_cascade_config(CHAMPION_CASCADE_CONFIG_PATH)
+    if config is None or not os.path.exists(CHAMPION_PREFILTER_PATH):
+        print("⚠️ Cascade requested but no champion pre-filter found; scoring every row with the champion.")
+        return None
+
+    print(f"🪜 Loading cascade pre-filter from {CHAMPION_PREFILTER_PATH} (threshold {config['threshold']:.4f})")
+    return joblib.load(CHAMPION_PREFILTER_PATH), config
+
+def generate_predictions(df, model, cascade=None, reason_codes=False):
     # Ensure ID column exists
     if 'ID' not in df.columns:
         df.insert(0, 'ID', range(1, len(df) + 1))
@@ -59,17 +93,28 @@ def generate_predictions(df, model):
 
     print(f"🔍 Generating predictions for {features.shape[0]} records...")
 
-    preds = model.predict(features)
-
-    if hasattr(model, "predict_proba"):
-        probs = model.predict_proba(features)[:, 1]
+    if cascade is not None:
+        prefilter, config = cascade
+        start = time.perf_counter()
+        preds, probs, escalated = cascade_predict(prefilter, model, features, config['threshold'])
+        elapsed = time.perf_counter() - start
+        print(f"🪜 Cascade escalated {escalated.sum()} of {len(escalated)} rows ({escalated.mean():.2%}) to the champion, "
+              f"{len(escalated) / elapsed:.0f} rows/s (holdout throughput gain {config.get('Cascade Throughput Gain', float('nan')):.1f}x).")
     else:
-        probs = [None] * len(preds)
+        preds = model.predict(features)
+
+        if hasattr(model, "predict_proba"):
+            probs = model.predict_proba(features)[:, 1]
+        else:
+            probs = [None] * len(preds)
 
     result_df = df.copy()
     result_df['PREDICTION'] = preds
     result_df['PREDICTION_PROB'] = probs
 
+    if reason_codes:
+        add_reason_codes(result_df, model, features)
+
     return result_df
 
 def save_predictions_to_snowflake(df):
@@ -78,6 +123,8 @@ def save_predictions_to_snowflake(df):
         cursor = conn.cursor()
         try:
             cursor.execute(f"TRUNCATE TABLE {BATCH_PREDICTIONS_TABLE}")
+            if 'REASON_CODES' in df.columns:
+                cursor.execute(f"ALTER TABLE {BATCH_PREDICTIONS_TABLE} ADD COLUMN IF NOT EXISTS REASON_CODES VARCHAR")
             conn.commit()
 
             cols = list(df.columns)
@@ -91,12 +138,49 @@ def save_predictions_to_snowflake(df):
         finally:
             cursor.close()
 
+def inference_fingerprint():
+    """Scoring inputs (batch table, champion files, config) and the current state of the predictions table."""
+    with get_snowflake_connection() as conn:
+        tables = table_fingerprints(conn, [BATCH_INPUT_TABLE, BATCH_PREDICTIONS_TABLE])
+    predictions_state = tables.pop(BATCH_PREDICTIONS_TABLE)
+    champion_files = ["champion_model.pkl", CHAMPION_METADATA_PATH]
+    if INFERENCE_CASCADE:
+        champion_files += [CHAMPION_PREFILTER_PATH, CHAMPION_CASCADE_CONFIG_PATH]
+    inputs = {
+        "tables": tables,
+        "champion": file_fingerprints(champion_files),
+        "code": file_fingerprints(["inferencing.py", "cascade.py", "reason_codes.py"]),
+        "config": {
+            "INFERENCE_CASCADE": INFERENCE_CASCADE,
+            "CASCADE_CONFIG": load_cascade_config(CHAMPION_CASCADE_CONFIG_PATH) if INFERENCE_CASCADE else None,
+            "REASON_CODES": REASON_CODES_ENABLED,
+            "REASON_CODE_ALERT_THRESHOLD": REASON_CODE_ALERT_THRESHOLD,
+            "REASON_CODE_TOP_K": REASON_CODE_TOP_K,
+        },
+    }
+    return StageFingerprint("inference", inputs), predictions_state
+
 def main():
     print("🚀 Starting batch inference...")
+    # Same batch, same champion and BATCH_PREDICTIONS untouched since our last write: nothing to rescore
+    fingerprint, predictions_state = inference_fingerprint()
+    if fingerprint.unchanged(predictions_state):
+        fingerprint.skip()
+        return
     batch_df = fetch_batch_data()
     model = get_champion_model()
-    predictions_df = generate_predictions(batch_df, model)
+    cascade = get_cascade_prefilter() if INFERENCE_CASCADE else None
+    start = time.perf_counter()
+    predictions_df = generate_predictions(batch_df, model, cascade, REASON_CODES_ENABLED)
+    scoring_ms = (time.perf_counter() - start) * 1000
     save_predictions_to_snowflake(predictions_df)
+    with get_snowflake_connection() as conn:
+        fingerprint.record(table_fingerprints(conn, [BATCH_PREDICTIONS_TABLE])[BATCH_PREDICTIONS_TABLE])
+    if PREDICTION_LOG_DIR:
+        # Per-row latency is the batch scoring time amortised over its rows
+        with PredictionLogWriter(PREDICTION_LOG_DIR) as writer:
+            writer.log_batch(predictions_df, get_champion_version(), scoring_ms / max(len(predictions_df), 1))
+        print(f"📝 {writer.rows_written} predictions logged to {PREDICTION_LOG_DIR} in {writer.files_written} files.")
     print("🏁 Batch inference pipeline completed.")
 
 if __name__ == "__main__":
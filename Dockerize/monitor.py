@@ -7,8 +7,14 @@ from evidently import Dataset, DataDefinition
 import json
 import io
 import sys
+import time
+import tracemalloc
+import numpy as np
 from evidently import BinaryClassification
 import pickle
+from prediction_log import read_prediction_logs
+from window_monitor import WindowMonitorState, load_window_state, save_window_state, WINDOW_STATE_PATH
+from fingerprint import StageFingerprint, table_fingerprints, file_fingerprints, file_sha256
 from dotenv import load_dotenv
 from datetime import datetime
 # Load environment variables
@@ -36,12 +42,40 @@ schema = os.getenv('SNOWFLAKE_SCHEMA')
 mlflow.set_tracking_uri(os.getenv("MLFLOW_TRACKING_URI",'http://127.0.0.1:5000'))
 mlflow.set_experiment("Monitoring_Experiments_V1")
 
-def fetch_from_snowflake(query):
-    conn = snowflake.connector.connect(
+# Stratified sampling mode for large batches (set MONITOR_SAMPLING=1 to enable)
+SAMPLING_ENABLED = os.getenv("MONITOR_SAMPLING", "0") == "1"
+SAMPLE_NEGATIVE_FRACTION = float(os.getenv("MONITOR_NEGATIVE_FRACTION", "0.1"))
+SAMPLE_POSITIVE_QUOTA = int(os.getenv("MONITOR_POSITIVE_QUOTA", "0"))  # 0 keeps every positive
+SAMPLE_SEED = int(os.getenv("MONITOR_SAMPLE_SEED", "42"))
+BOOTSTRAP_ROUNDS = int(os.getenv("MONITOR_BOOTSTRAP_ROUNDS", "200"))
+# Also run the full report once and log time/memory of both runs
+BENCHMARK_SAMPLING = os.getenv("MONITOR_BENCHMARK_SAMPLING", "0") == "1"
+
+# "snapshot" compares the whole reference and current tables, "window" keeps rolling state
+MONITOR_MODE = os.getenv("MONITOR_MODE", "snapshot")
+
+# Current data comes from CREDITCARD_BATCH_INPUTS ("snowflake") or the prediction log ("prediction_log")
+MONITOR_CURRENT_SOURCE = os.getenv("MONITOR_CURRENT_SOURCE", "snowflake")
+PREDICTION_LOG_DIR = os.getenv("PREDICTION_LOG_DIR", "prediction_logs")
+MONITOR_LOG_LOOKBACK_HOURS = float(os.getenv("MONITOR_LOG_LOOKBACK_HOURS", "168"))
+
+REFERENCE_TABLE = "CREDITCARD_REFERENCE.PUBLIC.CREDITCARD_REFERENCE"
+CURRENT_TABLE = "CREDITCARD.PUBLIC.CREDITCARD_BATCH_INPUTS"
+
+# Where the Evidently report and Retrain.csv are written (the container mounts /app/artifacts)
+MONITOR_OUTPUT_DIR = os.getenv("MONITOR_OUTPUT_DIR", ".")
+REPORT_PATH = os.path.join(MONITOR_OUTPUT_DIR, "evidently_report.html")
+RETRAIN_PATH = os.path.join(MONITOR_OUTPUT_DIR, "Retrain.csv")
+
+def get_snowflake_connection():
+    return snowflake.connector.connect(
         user=user, password=password,
         account=account, warehouse=warehouse,
         database=database, schema=schema
     )
+
+def fetch_from_snowflake(query):
+    conn = get_snowflake_connection()
     df = conn.cursor().execute(query).fetch_pandas_all()
     conn.close()
     return df
@@ -74,27 +108,62 @@ def load_champion_model():
     print("✅ Loaded champion model from local champion_model.pkl")
     return model
 
-def calc_metrics(y_true, y_pred):
+def calc_metrics(y_true, y_pred, sample_weight=None):
     return {
-        "Accuracy": accuracy_score(y_true, y_pred),
-        "Precision": precision_score(y_true, y_pred),
-        "Recall": recall_score(y_true, y_pred),
-        "F1_Score": f1_score(y_true, y_pred),
-        "MatthewsCorrcoef": matthews_corrcoef(y_true, y_pred),
+        "Accuracy": accuracy_score(y_true, y_pred, sample_weight=sample_weight),
+        "Precision": precision_score(y_true, y_pred, sample_weight=sample_weight),
+        "Recall": recall_score(y_true, y_pred, sample_weight=sample_weight),
+        "F1_Score": f1_score(y_true, y_pred, sample_weight=sample_weight),
+        "MatthewsCorrcoef": matthews_corrcoef(y_true, y_pred, sample_weight=sample_weight),
     }
 
-def main():
-    model = load_champion_model()
+def stratified_sample(df, target, negative_fraction, positive_quota=0, seed=42):
+    """Keep every positive (or a fixed quota), downsample negatives, and weight rows back to the full table."""
+    rng = np.random.default_rng(seed)
+    is_positive = (df[target] == 1).to_numpy()
+    pos_idx = np.flatnonzero(is_positive)
+    neg_idx = np.flatnonzero(~is_positive)
 
-    ref = fetch_from_snowflake("SELECT * FROM CREDITCARD_REFERENCE.PUBLIC.CREDITCARD_REFERENCE")
-    cur = fetch_from_snowflake("SELECT * FROM CREDITCARD.PUBLIC.CREDITCARD_BATCH_INPUTS")
-    target = "CLASS"
+    n_pos = len(pos_idx) if positive_quota <= 0 else min(positive_quota, len(pos_idx))
+    n_neg = min(len(neg_idx), max(1, int(round(len(neg_idx) * negative_fraction)))) if len(neg_idx) else 0
 
-    # Only use original feature columns for prediction and monitoring
-    feature_cols = [col for col in ref.columns if col not in ['ID', 'CLASS', 'PREDICTION', 'PREDICTION_PROB']]
-    ref[feature_cols] = ref[feature_cols].apply(pd.to_numeric, errors='coerce')
-    cur[feature_cols] = cur[feature_cols].apply(pd.to_numeric, errors='coerce')
+    keep = np.sort(np.concatenate([
+        rng.choice(pos_idx, n_pos, replace=False),
+        rng.choice(neg_idx, n_neg, replace=False),
+    ]))
+    sample = df.iloc[keep].copy()
+
+    # Inverse inclusion probability per stratum
+    pos_weight = len(pos_idx) / n_pos if n_pos else 0.0
+    neg_weight = len(neg_idx) / n_neg if n_neg else 0.0
+    sample["SAMPLE_WEIGHT"] = np.where(is_positive[keep], pos_weight, neg_weight)
+    return sample
 
+def calc_metrics_ci(y_true, y_pred, sample_weight, n_rounds=200, alpha=0.05, seed=42):
+    """Percentile bootstrap intervals for calc_metrics, resampling within each class stratum."""
+    rng = np.random.default_rng(seed)
+    y_true = np.asarray(y_true)
+    y_pred = np.asarray(y_pred)
+    sample_weight = np.asarray(sample_weight)
+    strata = [np.flatnonzero(y_true == c) for c in np.unique(y_true)]
+
+    draws = {}
+    for _ in range(n_rounds):
+        idx = np.concatenate([rng.choice(s, len(s), replace=True) for s in strata])
+        for k, v in calc_metrics(y_true[idx], y_pred[idx], sample_weight[idx]).items():
+            draws.setdefault(k, []).append(v)
+    return {
+        k: (float(np.percentile(v, 100 * alpha / 2)), float(np.percentile(v, 100 * (1 - alpha / 2))))
+        for k, v in draws.items()
+    }
+
+def score_and_report(model, ref, cur, feature_cols, target, classification=True):
+    """Predict on both frames, run the Evidently report and compute (weighted) metrics.
+
+    Evidently has no sample weights, so its classification panel would show
+    unweighted metrics on a positive-enriched sample; pass classification=False
+    for sampled frames and rely on the weighted metrics returned here.
+    """
     ref["prediction"] = model.predict(ref[feature_cols])
     cur["prediction"] = model.predict(cur[feature_cols])
 
@@ -108,22 +177,191 @@ def main():
         prediction_labels="prediction")],
     categorical_columns=["CLASS", "prediction"])
 
+    # Sample weights are bookkeeping, not a monitored feature
+    ds_ref = Dataset.from_pandas(ref.drop(columns=["SAMPLE_WEIGHT"], errors="ignore"), data_definition=dd)
+    ds_cur = Dataset.from_pandas(cur.drop(columns=["SAMPLE_WEIGHT"], errors="ignore"), data_definition=dd)
 
-    ds_ref = Dataset.from_pandas(ref, data_definition=dd)
-    ds_cur = Dataset.from_pandas(cur, data_definition=dd)
-
-    report = Report(metrics=[
-        DataDriftPreset(),
-        ClassificationPreset()
-    ])
+    report = Report(metrics=[DataDriftPreset(), ClassificationPreset()] if classification else [DataDriftPreset()])
 
     result = report.run(reference_data=ds_ref, current_data=ds_cur)
-    output_path = "evidently_report.html"
-    result.save_html(output_path)
-    print("✅ Evidently report generated: evidently_report.html")
 
-    ref_metrics = calc_metrics(ref[target], ref["prediction"])
-    cur_metrics = calc_metrics(cur[target], cur["prediction"])
+    ref_metrics = calc_metrics(ref[target], ref["prediction"], ref.get("SAMPLE_WEIGHT"))
+    cur_metrics = calc_metrics(cur[target], cur["prediction"], cur.get("SAMPLE_WEIGHT"))
+    return result, ref_metrics, cur_metrics
+
+def sample_pair(ref, cur, target):
+    ref_sample = stratified_sample(ref, target, SAMPLE_NEGATIVE_FRACTION, SAMPLE_POSITIVE_QUOTA, SAMPLE_SEED)
+    cur_sample = stratified_sample(cur, target, SAMPLE_NEGATIVE_FRACTION, SAMPLE_POSITIVE_QUOTA, SAMPLE_SEED + 1)
+    return ref_sample, cur_sample
+
+def benchmark_sampling(model, ref, cur, feature_cols, target):
+    """Wall time and peak traced memory of the full run versus the sampled run."""
+    results = {}
+    for mode in ["Full", "Sampled"]:
+        tracemalloc.start()
+        start = time.perf_counter()
+        if mode == "Sampled":
+            r, c = sample_pair(ref, cur, target)
+        else:
+            r, c = ref.copy(), cur.copy()
+        score_and_report(model, r, c, feature_cols, target)
+        results[f"Benchmark_{mode}_Seconds"] = time.perf_counter() - start
+        results[f"Benchmark_{mode}_Peak_MB"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+    results["Benchmark_Speedup"] = results["Benchmark_Full_Seconds"] / results["Benchmark_Sampled_Seconds"]
+    print("\n⏱️ Sampling benchmark (full vs sampled):")
+    for k, v in results.items():
+        print(f"{k}: {v:.3f}")
+    return results
+
+def fetch_current_data(columns):
+    """Current batch; prediction log rows are cut down to the reference columns (features plus CLASS)."""
+    if MONITOR_CURRENT_SOURCE != "prediction_log":
+        return fetch_from_snowflake(f"SELECT * FROM {CURRENT_TABLE}")
+
+    since = pd.Timestamp.now(tz="UTC") - pd.Timedelta(hours=MONITOR_LOG_LOOKBACK_HOURS)
+    cur = read_prediction_logs(PREDICTION_LOG_DIR, since=since)
+    print(f"📥 Read {len(cur)} logged predictions from {PREDICTION_LOG_DIR} (last {MONITOR_LOG_LOOKBACK_HOURS:g}h)")
+    if "CLASS" not in cur.columns:
+        raise ValueError(f"Prediction logs in {PREDICTION_LOG_DIR} have no CLASS labels to monitor against.")
+    missing = [c for c in columns if c not in cur.columns]
+    if missing:
+        raise ValueError(f"Prediction logs in {PREDICTION_LOG_DIR} are missing reference columns: {', '.join(missing)}")
+    # Requests logged by serve.py carry no label; their CLASS is NaN once mixed with batch-scored logs
+    unlabelled = cur["CLASS"].isna()
+    if unlabelled.any():
+        print(f"ℹ️ Dropping {int(unlabelled.sum())} unlabelled logged predictions")
+        cur = cur[~unlabelled]
+    if cur.empty:
+        raise ValueError(f"Prediction logs in {PREDICTION_LOG_DIR} have no labelled rows to monitor against.")
+    # Scores, reason codes and log bookkeeping must not reach the drift report as features
+    return cur[columns].reset_index(drop=True)
+
+def main_window():
+    """Fold only new batch rows into the rolling window state and decide on retraining from it."""
+    model = load_champion_model()
+    model_id = file_sha256("champion_model.pkl")
+    target = "CLASS"
+
+    state = load_window_state(WINDOW_STATE_PATH)
+    if state is None or state.model_id != model_id:
+        # New champion: windowed counts from the old model no longer apply
+        print("🆕 Initialising window state from reference table")
+        ref = fetch_from_snowflake(f"SELECT * FROM {REFERENCE_TABLE}")
+        feature_cols = [col for col in ref.columns if col not in ['ID', 'CLASS', 'PREDICTION', 'PREDICTION_PROB']]
+        ref[feature_cols] = ref[feature_cols].apply(pd.to_numeric, errors='coerce')
+        state = WindowMonitorState.from_reference(ref, model, feature_cols, target, model_id=model_id)
+
+    # TIME repeats and restarts per batch, so progress is tracked by table fingerprint and row hashes
+    conn = get_snowflake_connection()
+    batch_fingerprint = table_fingerprints(conn, [CURRENT_TABLE])[CURRENT_TABLE]
+    conn.close()
+    if batch_fingerprint == state.batch_fingerprint:
+        print(f"🪟 {CURRENT_TABLE} unchanged since last run; nothing to fold in")
+    else:
+        cur = fetch_from_snowflake(f"SELECT *, HASH(*) AS ROW_HASH FROM {CURRENT_TABLE}")
+        row_hashes = cur.pop("ROW_HASH").to_numpy(dtype=np.int64)
+        cur[state.feature_cols] = cur[state.feature_cols].apply(pd.to_numeric, errors='coerce')
+        # Only rows not folded yet need scoring
+        fresh = state.new_rows(row_hashes)
+        cur["prediction"] = 0
+        if fresh.any():
+            cur.loc[fresh, "prediction"] = model.predict(cur.loc[fresh, state.feature_cols])
+        added = state.update(cur, row_hashes, target=target)
+        state.batch_fingerprint = batch_fingerprint
+        print(f"🪟 Folded {added} new rows into window state (batch {state.batches}, TIME offset {state.time_offset:g}s)")
+
+    decision, rationale, window_metrics = state.retrain_decision()
+    save_window_state(state, WINDOW_STATE_PATH)
+    os.makedirs(MONITOR_OUTPUT_DIR, exist_ok=True)
+
+    pd.DataFrame({
+        "Retraining_Decision": [decision],
+        "Rationale": [rationale]
+    }).to_csv(RETRAIN_PATH, index=False)
+    insert_retraining_decision_to_snowflake(decision, rationale)
+
+    with mlflow.start_run(run_name="Monitoring_Champion_Window") as run:
+        mlflow.log_artifact(RETRAIN_PATH)
+        mlflow.log_artifact(WINDOW_STATE_PATH)
+        for k, v in window_metrics.items():
+            mlflow.log_metric(f"Window_{k}", v)
+        for k, v in state.reference["metrics"].items():
+            mlflow.log_metric(f"Reference_{k}", v)
+        mlflow.set_tag("Retrain_Decision", decision)
+        mlflow.set_tag("Rationale", rationale)
+        mlflow.set_tag("Monitor_Mode", "window")
+        mlflow.set_tag("Model_Stage", "Production")
+        mlflow.set_tag("Model_Role", "Champion")
+
+    print(f"Windowed monitoring complete. Retrain decision: {decision}")
+
+def monitor_fingerprint():
+    """Snapshot inputs: both tables' warehouse-side fingerprints, the champion and the monitoring config."""
+    if MONITOR_CURRENT_SOURCE == "prediction_log":
+        # The lookback window moves with the clock, so log-based runs always rerun
+        return None
+    conn = get_snowflake_connection()
+    tables = table_fingerprints(conn, [REFERENCE_TABLE, CURRENT_TABLE])
+    conn.close()
+    inputs = {
+        "tables": tables,
+        "champion": file_fingerprints(["champion_model.pkl"]),
+        "code": file_fingerprints(["monitor.py"]),
+        "config": {
+            "MONITOR_SAMPLING": SAMPLING_ENABLED,
+            "MONITOR_NEGATIVE_FRACTION": SAMPLE_NEGATIVE_FRACTION,
+            "MONITOR_POSITIVE_QUOTA": SAMPLE_POSITIVE_QUOTA,
+            "MONITOR_SAMPLE_SEED": SAMPLE_SEED,
+            "MONITOR_BOOTSTRAP_ROUNDS": BOOTSTRAP_ROUNDS,
+            "MONITOR_BENCHMARK_SAMPLING": BENCHMARK_SAMPLING,
+        },
+    }
+    return StageFingerprint("monitor", inputs, [REPORT_PATH, RETRAIN_PATH])
+
+def main():
+    if MONITOR_MODE == "window":
+        return main_window()
+
+    # Unchanged tables and champion would reproduce the same report and decision
+    fingerprint = monitor_fingerprint()
+    if fingerprint is not None and fingerprint.unchanged():
+        fingerprint.skip()
+        return
+    os.makedirs(MONITOR_OUTPUT_DIR, exist_ok=True)
+
+    model = load_champion_model()
+
+    ref = fetch_from_snowflake(f"SELECT * FROM {REFERENCE_TABLE}")
+    target = "CLASS"
+
+    # Only use original feature columns for prediction and monitoring
+    feature_cols = [col for col in ref.columns if col not in ['ID', 'CLASS', 'PREDICTION', 'PREDICTION_PROB']]
+    cur = fetch_current_data(feature_cols + [target])
+    ref[feature_cols] = ref[feature_cols].apply(pd.to_numeric, errors='coerce')
+    cur[feature_cols] = cur[feature_cols].apply(pd.to_numeric, errors='coerce')
+
+    benchmark = benchmark_sampling(model, ref, cur, feature_cols, target) if BENCHMARK_SAMPLING else {}
+
+    if SAMPLING_ENABLED:
+        full_rows = (len(ref), len(cur))
+        ref, cur = sample_pair(ref, cur, target)
+        print(f"🎲 Sampled reference {len(ref)}/{full_rows[0]} and current {len(cur)}/{full_rows[1]} rows "
+              f"(negative fraction {SAMPLE_NEGATIVE_FRACTION}, seed {SAMPLE_SEED})")
+
+    result, ref_metrics, cur_metrics = score_and_report(model, ref, cur, feature_cols, target,
+                                                        classification=not SAMPLING_ENABLED)
+    result.save_html(REPORT_PATH)
+    print(f"✅ Evidently report generated: {REPORT_PATH}")
+
+    # Bootstrap confidence intervals only make sense when metrics come from a sample
+    ref_ci, cur_ci = {}, {}
+    if SAMPLING_ENABLED:
+        ref_ci = calc_metrics_ci(ref[target], ref["prediction"], ref["SAMPLE_WEIGHT"], BOOTSTRAP_ROUNDS, seed=SAMPLE_SEED)
+        cur_ci = calc_metrics_ci(cur[target], cur["prediction"], cur["SAMPLE_WEIGHT"], BOOTSTRAP_ROUNDS, seed=SAMPLE_SEED)
+        print("\n📊 Current metrics (95% CI):")
+        for k, (low, high) in cur_ci.items():
+            print(f"{k}: {cur_metrics[k]:.4f} [{low:.4f}, {high:.4f}]")
 
     # Define degraded metrics based on threshold (example: accuracy drop > 0.05)
     degraded = []
@@ -139,23 +377,37 @@ def main():
     pd.DataFrame({
         "Retraining_Decision": [decision],
         "Rationale": [rationale]
-    }).to_csv("Retrain.csv", index=False)
+    }).to_csv(RETRAIN_PATH, index=False)
 
     insert_retraining_decision_to_snowflake(decision, rationale)
 
     with mlflow.start_run(run_name="Monitoring_Champion") as run:
-        mlflow.log_artifact("evidently_report.html")
+        mlflow.log_artifact(REPORT_PATH)
         # mlflow.log_artifact("metrics.json")
-        mlflow.log_artifact("Retrain.csv")
+        mlflow.log_artifact(RETRAIN_PATH)
         for k,v in cur_metrics.items():
             mlflow.log_metric(f"Current_{k}", v)
         for k,v in ref_metrics.items():
             mlflow.log_metric(f"Reference_{k}", v)
+        for prefix, ci in [("Current", cur_ci), ("Reference", ref_ci)]:
+            for k, (low, high) in ci.items():
+                mlflow.log_metric(f"{prefix}_{k}_CI_Low", low)
+                mlflow.log_metric(f"{prefix}_{k}_CI_High", high)
+        for k,v in benchmark.items():
+            mlflow.log_metric(k, v)
+        mlflow.set_tag("Sampling_Mode", "stratified" if SAMPLING_ENABLED else "full")
+        # Sampled reports carry drift only; the weighted Current_*/Reference_* metrics are authoritative
+        mlflow.set_tag("Report_Classification_Panel", "omitted (unweighted sample)" if SAMPLING_ENABLED else "included")
+        mlflow.set_tag("Current_Source", MONITOR_CURRENT_SOURCE)
+        if fingerprint is not None:
+            mlflow.set_tag("Input_Fingerprint", fingerprint.digest)
         mlflow.set_tag("Retrain_Decision", decision)
         mlflow.set_tag("Rationale", rationale)
         mlflow.set_tag("Model_Stage", "Production")
         mlflow.set_tag("Model_Role", "Champion")
 
+    if fingerprint is not None:
+        fingerprint.record()
     print("Monitoring complete. Report and metrics logged to MLflow.")
 
 if __name__ == "__main__":
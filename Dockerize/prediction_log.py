@@ -0,0 +1,190 @@
+import atexit
+import glob
+import os
+import threading
+import time
+from datetime import datetime, timezone
+import pandas as pd
+
+PREDICTION_LOG_DIR = os.getenv("PREDICTION_LOG_DIR", "prediction_logs")
+# Rotate a file once it holds this many rows or its first record is this old
+PREDICTION_LOG_MAX_ROWS = int(os.getenv("PREDICTION_LOG_MAX_ROWS", "50000"))
+PREDICTION_LOG_MAX_SECONDS = float(os.getenv("PREDICTION_LOG_MAX_SECONDS", "60"))
+# Upper bound on buffered records; log() blocks (backpressure) once it is reached
+PREDICTION_LOG_MAX_BUFFERED = int(os.getenv("PREDICTION_LOG_MAX_BUFFERED", "200000"))
+
+
+class PredictionLogWriter:
+    """Buffer scoring records in memory and flush them from a background thread as rotated Parquet files.
+
+    Callers only append to a bounded in-memory buffer, so the scoring path
+    pays neither a syscall nor serialisation per event. Files are written to
+    <log_dir>/date=YYYY-MM-DD/ via a temporary name and renamed into place,
+    so readers never see a partial file. close() (also registered with
+    atexit) drains and flushes everything still buffered.
+
+    A batch that fails to write (e.g. a column with mixed types) does not
+    stop the writer: it is pickled to <log_dir>/dead_letter/ and counted in
+    rows_failed, and close() raises once everything else has been flushed.
+    """
+
+    def __init__(self, log_dir=PREDICTION_LOG_DIR, max_rows=PREDICTION_LOG_MAX_ROWS,
+                 max_seconds=PREDICTION_LOG_MAX_SECONDS, max_buffered=PREDICTION_LOG_MAX_BUFFERED):
+        self.log_dir = log_dir
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+        self.max_buffered = max_buffered
+        # Single records and DataFrame batches waiting for the writer thread
+        self._records = []
+        self._frames = []
+        self._pending_rows = 0
+        self._in_flight_rows = 0
+        self._first_at = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self._sequence = 0
+        self.files_written = 0
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.last_error = None
+        # Batches that could not even be dead-lettered stay here for the caller
+        self.failed_frames = []
+        os.makedirs(log_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="prediction-log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, features, score, prediction, model_version, latency_ms, request_id=None):
+        """Record one scoring decision; features is a dict of feature name to value."""
+        record = dict(features)
+        record["PREDICTION"] = int(prediction)
+        record["PREDICTION_PROB"] = float(score)
+        record["MODEL_VERSION"] = str(model_version)
+        record["LATENCY_MS"] = float(latency_ms)
+        record["REQUEST_ID"] = request_id
+        record["LOGGED_AT"] = time.time()
+        self._put(record, 1)
+
+    def log_batch(self, df, model_version, latency_ms):
+        """Record a scored DataFrame (features plus PREDICTION/PREDICTION_PROB) in one call."""
+        batch = df.assign(MODEL_VERSION=str(model_version), LATENCY_MS=float(latency_ms), LOGGED_AT=time.time())
+        if "REQUEST_ID" not in batch.columns:
+            batch["REQUEST_ID"] = None
+        # Split so one huge batch can't exceed the buffer bound on its own
+        for start in range(0, len(batch), self.max_rows):
+            part = batch.iloc[start:start + self.max_rows]
+            self._put(part, len(part))
+
+    def _put(self, item, n_rows):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("PredictionLogWriter is closed")
+            # Backpressure: wait for the writer once the bound is hit (an empty buffer always accepts)
+            while self._pending_rows + self._in_flight_rows and \
+                    self._pending_rows + self._in_flight_rows + n_rows > self.max_buffered:
+                self._cond.wait()
+            if n_rows == 1 and not isinstance(item, pd.DataFrame):
+                self._records.append(item)
+            else:
+                self._frames.append(item)
+            self._pending_rows += n_rows
+            if self._first_at is None:
+                # Wake the writer so it starts the age timer for this file
+                self._first_at = time.monotonic()
+                self._cond.notify_all()
+            elif self._pending_rows >= self.max_rows:
+                self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and self._pending_rows < self.max_rows:
+                    if self._first_at is None:
+                        self._cond.wait()
+                        continue
+                    remaining = self._first_at + self.max_seconds - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if not self._pending_rows and self._closed:
+                    return
+                frames, records = self._frames, self._records
+                n_rows = self._pending_rows
+                self._records, self._frames, self._pending_rows, self._first_at = [], [], 0, None
+                self._in_flight_rows = n_rows
+
+            try:
+                if n_rows:
+                    self._flush(frames + ([pd.DataFrame(records)] if records else []))
+            except Exception as e:
+                self._dead_letter(frames, records, n_rows, e)
+            finally:
+                # Always release the rows, or log() would block on them forever
+                with self._cond:
+                    self._in_flight_rows = 0
+                    self._cond.notify_all()
+
+    def _flush(self, frames):
+        df = pd.concat(frames, ignore_index=True)
+        df["LOGGED_AT"] = pd.to_datetime(df["LOGGED_AT"], unit="s", utc=True)
+        now = datetime.now(timezone.utc)
+        part_dir = os.path.join(self.log_dir, f"date={now:%Y-%m-%d}")
+        os.makedirs(part_dir, exist_ok=True)
+        self._sequence += 1
+        file_name = f"predictions-{now:%Y%m%dT%H%M%S}-{os.getpid()}-{self._sequence:06d}.parquet"
+        tmp_path = os.path.join(part_dir, f".{file_name}.tmp")
+        df.to_parquet(tmp_path, compression="zstd", index=False)
+        os.replace(tmp_path, os.path.join(part_dir, file_name))
+        self.files_written += 1
+        self.rows_written += len(df)
+
+    def _dead_letter(self, frames, records, n_rows, error):
+        """Keep a batch that failed to write as a pickle, which accepts any column types."""
+        self.rows_failed += n_rows
+        self.last_error = error
+        dead_dir = os.path.join(self.log_dir, "dead_letter")
+        self._sequence += 1
+        path = os.path.join(dead_dir, f"predictions-{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-"
+                                      f"{os.getpid()}-{self._sequence:06d}.pkl")
+        try:
+            os.makedirs(dead_dir, exist_ok=True)
+            pd.to_pickle({"frames": frames, "records": records, "error": repr(error)}, path)
+            print(f"❌ Could not write {n_rows} prediction log rows ({error!r}); kept them in {path}.")
+        except Exception as e:
+            self.failed_frames.append((frames, records))
+            print(f"❌ Could not write {n_rows} prediction log rows ({error!r}) "
+                  f"or dead-letter them ({e!r}); kept them in memory.")
+
+    def close(self):
+        """Flush everything still buffered and stop the writer thread."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        atexit.unregister(self.close)
+        if self.rows_failed:
+            raise RuntimeError(f"{self.rows_failed} prediction log rows could not be written to {self.log_dir} "
+                               f"(last error: {self.last_error!r}); see {os.path.join(self.log_dir, 'dead_letter')}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_prediction_logs(log_dir=PREDICTION_LOG_DIR, since=None):
+    """Load logged predictions as one DataFrame, optionally only those logged after `since`."""
+    files = sorted(glob.glob(os.path.join(log_dir, "date=*", "predictions-*.parquet")))
+    if since is not None:
+        since = pd.Timestamp(since, tz="UTC") if pd.Timestamp(since).tzinfo is None else pd.Timestamp(since)
+        # Partition directories let us skip whole days before opening any file
+        files = [f for f in files if os.path.basename(os.path.dirname(f))[5:] >= f"{since:%Y-%m-%d}"]
+    if not files:
+        return pd.DataFrame()
+    df = pd.concat((pd.read_parquet(f) for f in files), ignore_index=True)
+    if since is not None:
+        df = df[df["LOGGED_AT"] > since]
+    return df
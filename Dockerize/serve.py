@@ -0,0 +1,355 @@
+import argparse
+import gc
+import http.client
+import io
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import joblib
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from prediction_log import PredictionLogWriter
+
+# Load environment variables
+load_dotenv()
+
+SERVE_HOST = os.getenv("SERVE_HOST", "0.0.0.0")
+SERVE_PORT = int(os.getenv("SERVE_PORT", "8080"))
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", str(os.cpu_count() or 1)))
+# How often the parent checks champion_model.pkl for a new champion
+SERVE_RELOAD_POLL_SECONDS = float(os.getenv("SERVE_RELOAD_POLL_SECONDS", "5"))
+# How long an old worker may finish in-flight requests before it is killed
+SERVE_DRAIN_SECONDS = float(os.getenv("SERVE_DRAIN_SECONDS", "30"))
+PREDICTION_LOG_DIR = os.getenv("PREDICTION_LOG_DIR")
+
+MODEL_PATH = "champion_model.pkl"
+METADATA_PATH = "champion_model.json"
+
+
+def load_model():
+    """Load the champion and its registry version; returns (model, version, file mtime)."""
+    mtime = os.path.getmtime(MODEL_PATH)
+    model = joblib.load(MODEL_PATH)
+    version = "unknown"
+    if os.path.exists(METADATA_PATH):
+        with open(METADATA_PATH, "r") as f:
+            version = str(json.load(f).get("version", "unknown"))
+    return model, version, mtime
+
+
+def memory_stats(pid="self"):
+    """RSS, PSS and shared/private split in MB from /proc; PSS splits shared pages across the processes mapping them."""
+    stats = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty"):
+                    stats[key] = int(rest.split()[0]) / 1024
+    except OSError:
+        pass
+    return stats
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    # One request per connection (HTTP/1.0): a synchronous worker held by an idle
+    # keep-alive client would stop accepting; slow clients are dropped after the timeout
+    timeout = 5
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok", "pid": os.getpid(), "model_version": self.server.model_version})
+        elif self.path == "/stats":
+            self._send_json(200, {"pid": os.getpid(), "model_version": self.server.model_version,
+                                  "requests": self.server.requests_served, "memory_mb": memory_stats()})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self._send_json(404, {"error": "not found"})
+            return
+        start = time.perf_counter()
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            records = payload["records"] if isinstance(payload, dict) and "records" in payload else payload
+            records = records if isinstance(records, list) else [records]
+            features = pd.DataFrame.from_records(records, columns=self.server.feature_names)
+            probs = self.server.model.predict_proba(features)[:, 1]
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        preds = (probs > 0.5).astype(int)
+        latency_ms = (time.perf_counter() - start) * 1000
+        self.server.requests_served += 1
+        self._send_json(200, {
+            "predictions": preds.tolist(),
+            "probabilities": probs.tolist(),
+            "model_version": self.server.model_version,
+        })
+        if self.server.log_writer is not None:
+            # Log the parsed feature frame, not the client's dicts: their keys and value types are arbitrary
+            logged = features.apply(pd.to_numeric, errors='coerce').astype(float)
+            logged["PREDICTION"] = preds
+            logged["PREDICTION_PROB"] = probs
+            self.server.log_writer.log_batch(logged, self.server.model_version, latency_ms / len(logged))
+
+    def log_message(self, format, *args):
+        # One line per request would cost more than scoring it
+        pass
+
+
+def worker_main(listen_sock, model, model_version):
+    """Accept connections on the shared socket until SIGTERM, then finish the current request and exit."""
+    server = HTTPServer((SERVE_HOST, SERVE_PORT), ScoringHandler, bind_and_activate=False)
+    server.socket.close()
+    server.socket = listen_sock
+    # Non-blocking listen socket: a worker that loses the accept race just polls again
+    server.timeout = 0.5
+    server.model = model
+    server.model_version = model_version
+    server.feature_names = list(getattr(model, "feature_names_in_", [])) or None
+    server.requests_served = 0
+    server.stopping = False
+    server.log_writer = PredictionLogWriter(PREDICTION_LOG_DIR) if PREDICTION_LOG_DIR else None
+
+    def stop(signum, frame):
+        server.stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    while not server.stopping:
+        server.handle_request()
+    if server.log_writer is not None:
+        server.log_writer.close()
+
+
+class PreforkServer:
+    """Parent process: owns the listening socket and the model, forks workers and rolls them on champion updates."""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((SERVE_HOST, SERVE_PORT))
+        self.sock.listen(1024)
+        self.sock.setblocking(False)
+        self.children = {}  # pid -> generation
+        self.generation = 0
+        self.stopping = False
+        self.reload_requested = False
+        self._install_model(*load_model())
+
+    def _install_model(self, model, version, mtime):
+        self.model, self.model_version, self.model_mtime = model, version, mtime
+        # Move everything allocated so far out of the GC's reach, so collections in
+        # the workers don't write to (and un-share) the model's pages
+        gc.collect()
+        gc.freeze()
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            # The child must never return into the parent's supervisor loop
+            status = 1
+            try:
+                worker_main(self.sock, self.model, self.model_version)
+                status = 0
+            except Exception:
+                traceback.print_exc()
+            finally:
+                sys.stdout.flush()
+                os._exit(status)
+        self.children[pid] = self.generation
+        return pid
+
+    def stop_worker(self, pid):
+        """SIGTERM a worker and wait for it to drain, killing it after SERVE_DRAIN_SECONDS."""
+        os.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + SERVE_DRAIN_SECONDS
+        while time.monotonic() < deadline:
+            if os.waitpid(pid, os.WNOHANG)[0] == pid:
+                break
+            time.sleep(0.05)
+        else:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.children.pop(pid, None)
+
+    def rolling_reload(self):
+        """Swap in the new champion one worker at a time, so the socket always has N workers accepting."""
+        try:
+            model, version, mtime = load_model()
+        except Exception as e:
+            print(f"❌ Could not load new champion, keeping version {self.model_version}: {e}")
+            self.model_mtime = os.path.getmtime(MODEL_PATH)
+            return
+        print(f"🔄 Rolling reload: version {self.model_version} -> {version}")
+        old_pids = list(self.children)
+        self.generation += 1
+        self._install_model(model, version, mtime)
+        for pid in old_pids:
+            self.spawn()
+            self.stop_worker(pid)
+        print(f"✅ All {self.workers} workers serving version {version}")
+
+    def reap(self):
+        """Respawn workers that died on their own."""
+        while self.children:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+            if self.children.pop(pid, None) is not None and not self.stopping:
+                print(f"⚠️ Worker {pid} exited unexpectedly; respawning.")
+                self.spawn()
+
+    def run(self):
+        def request_stop(signum, frame):
+            self.stopping = True
+
+        def request_reload(signum, frame):
+            self.reload_requested = True
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGHUP, request_reload)
+
+        for _ in range(self.workers):
+            self.spawn()
+        print(f"🚀 Serving model version {self.model_version} on {SERVE_HOST}:{SERVE_PORT} "
+              f"with {self.workers} workers (parent pid {os.getpid()})")
+
+        while not self.stopping:
+            time.sleep(min(SERVE_RELOAD_POLL_SECONDS, 0.5))
+            self.reap()
+            try:
+                changed = os.path.getmtime(MODEL_PATH) != self.model_mtime
+            except OSError:
+                changed = False  # Mid-copy; try again next poll
+            if changed or self.reload_requested:
+                self.reload_requested = False
+                self.rolling_reload()
+
+        print("🛑 Shutting down workers...")
+        for pid in list(self.children):
+            self.stop_worker(pid)
+        self.sock.close()
+
+
+def child_pids(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children", "r") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def bench_worker_counts(worker_counts, duration, concurrency):
+    """Start the server at each worker count, drive it closed-loop and report throughput and per-worker memory."""
+    model = joblib.load(MODEL_PATH)
+    rng = np.random.default_rng(42)
+    columns = list(model.feature_names_in_)
+    bodies = [json.dumps({"records": [dict(zip(columns, row))]}).encode("utf-8")
+              for row in rng.normal(size=(256, len(columns))).tolist()]
+    del model
+
+    results = []
+    for workers in worker_counts:
+        proc = subprocess.Popen([sys.executable, __file__, "--workers", str(workers)],
+                                stdout=subprocess.DEVNULL)
+        for _ in range(100):
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", SERVE_PORT, timeout=1)
+                conn.request("GET", "/health")
+                conn.getresponse().read()
+                break
+            except OSError:
+                time.sleep(0.2)
+
+        latencies, errors = [], [0]
+        deadline = time.monotonic() + duration
+
+        def client(i):
+            conn = http.client.HTTPConnection("127.0.0.1", SERVE_PORT, timeout=10)
+            n = i
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    conn.request("POST", "/predict", bodies[n % len(bodies)], {"Content-Type": "application/json"})
+                    response = conn.getresponse()
+                    response.read()
+                    if response.status == 200:
+                        latencies.append(time.perf_counter() - start)
+                    else:
+                        errors[0] += 1
+                except (OSError, http.client.HTTPException):
+                    errors[0] += 1
+                    conn.close()
+                    conn = http.client.HTTPConnection("127.0.0.1", SERVE_PORT, timeout=10)
+                n += concurrency
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        worker_mem = [memory_stats(pid) for pid in child_pids(proc.pid)]
+        parent_mem = memory_stats(proc.pid)
+        proc.send_signal(signal.SIGTERM)
+        proc.wait()
+
+        lat_ms = np.array(latencies) * 1000
+        results.append({
+            "workers": workers,
+            "requests_per_sec": len(latencies) / duration,
+            "p50_ms": float(np.percentile(lat_ms, 50)) if len(lat_ms) else float("nan"),
+            "p99_ms": float(np.percentile(lat_ms, 99)) if len(lat_ms) else float("nan"),
+            "errors": errors[0],
+            "parent_rss_mb": parent_mem.get("Rss", float("nan")),
+            "worker_rss_mb": float(np.mean([m.get("Rss", np.nan) for m in worker_mem])),
+            "worker_pss_mb": float(np.mean([m.get("Pss", np.nan) for m in worker_mem])),
+            "worker_private_mb": float(np.mean([m.get("Private_Clean", 0) + m.get("Private_Dirty", 0) for m in worker_mem])),
+            "total_pss_mb": parent_mem.get("Pss", 0) + sum(m.get("Pss", 0) for m in worker_mem),
+        })
+
+    print(pd.DataFrame(results).to_string(index=False, float_format=lambda v: f"{v:.1f}"))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-forked multi-worker scoring server for the champion model.")
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    parser.add_argument("--bench", help="Comma-separated worker counts to benchmark, e.g. 1,2,4")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds of load per worker count")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent benchmark clients")
+    args = parser.parse_args()
+
+    if args.bench:
+        bench_worker_counts([int(n) for n in args.bench.split(",")], args.duration, args.concurrency)
+    else:
+        PreforkServer(args.workers).run()
+
+
+if __name__ == "__main__":
+    # Fix Windows stdout encoding issue
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', line_buffering=True)
+    main()
@@ -0,0 +1,280 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from fingerprint import file_sha256  # Re-exported for existing importers
+
+# Window layout: WINDOW_BUCKETS buckets of WINDOW_BUCKET_SECONDS each over the TIME column
+WINDOW_BUCKET_SECONDS = int(os.getenv("WINDOW_BUCKET_SECONDS", "3600"))
+WINDOW_BUCKETS = int(os.getenv("WINDOW_BUCKETS", "24"))
+# Kept next to the monitoring outputs so it survives the container (MONITOR_OUTPUT_DIR is the mounted artifacts dir)
+WINDOW_STATE_PATH = os.getenv("WINDOW_STATE_PATH",
+                              os.path.join(os.getenv("MONITOR_OUTPUT_DIR", "."), "window_state.json"))
+
+# Retrain thresholds on windowed metrics
+WINDOW_METRIC_DROP = float(os.getenv("WINDOW_METRIC_DROP", "0.1"))
+WINDOW_DRIFT_EFFECT_SIZE = float(os.getenv("WINDOW_DRIFT_EFFECT_SIZE", "0.25"))
+WINDOW_MAX_DRIFTED_FEATURES = int(os.getenv("WINDOW_MAX_DRIFTED_FEATURES", "3"))
+WINDOW_MIN_ROWS = int(os.getenv("WINDOW_MIN_ROWS", "1000"))
+WINDOW_MIN_POSITIVES = int(os.getenv("WINDOW_MIN_POSITIVES", "10"))
+
+DEGRADATION_METRICS = ["Accuracy", "Precision", "Recall", "F1_Score"]
+
+
+def metrics_from_confusion(tn, fp, fn, tp):
+    """Same metrics as monitor.calc_metrics, computed from confusion counts."""
+    tn, fp, fn, tp = (float(x) for x in (tn, fp, fn, tp))
+    total = tn + fp + fn + tp
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    mcc_denom = np.sqrt((tp + fp) * (tp + fn) * (tn + fp) * (tn + fn))
+    return {
+        "Accuracy": (tp + tn) / total if total else 0.0,
+        "Precision": precision,
+        "Recall": recall,
+        "F1_Score": f1,
+        "MatthewsCorrcoef": float((tp * tn - fp * fn) / mcc_denom) if mcc_denom else 0.0,
+    }
+
+
+def confusion_counts(y_true, y_pred, groups=None, n_groups=1):
+    """Return (n_groups, 4) counts of tn, fp, fn, tp with one bincount pass."""
+    code = 2 * np.asarray(y_true, dtype=np.int64) + np.asarray(y_pred, dtype=np.int64)
+    if groups is None:
+        groups = np.zeros(len(code), dtype=np.int64)
+    return np.bincount(groups * 4 + code, minlength=n_groups * 4).reshape(n_groups, 4)
+
+
+class WindowMonitorState:
+    """Ring buffer of per-bucket confusion counts and feature moments over the TIME column.
+
+    Each slot holds one TIME bucket. A batch is folded in with a handful of
+    bincounts, so an update costs O(batch) and windowed metrics cost
+    O(buckets x features) no matter how much history has gone through.
+
+    TIME restarts at 0 in every batch file and repeats within one, so it is
+    only the bucketing axis: it is neither summarised nor checked for drift
+    (a window is always later than the reference mean). Progress is tracked by row hashes of the
+    current batch: rows already folded are skipped by hash, and a batch
+    sharing no rows with the previous one is shifted to start in the bucket
+    after the newest one.
+    """
+
+    def __init__(self, feature_cols, bucket_seconds=WINDOW_BUCKET_SECONDS, n_buckets=WINDOW_BUCKETS,
+                 model_id=None, reference=None, time_col="TIME"):
+        # Model inputs (scored in full) and the subset whose moments are tracked for drift
+        self.feature_cols = list(feature_cols)
+        self.time_col = time_col
+        self.drift_cols = [c for c in self.feature_cols if c != time_col]
+        self.bucket_seconds = bucket_seconds
+        self.n_buckets = n_buckets
+        self.model_id = model_id
+        # Reference summary: metrics plus mean/std per drift column, computed once per champion
+        self.reference = reference or {}
+        n_features = len(self.drift_cols)
+        self.bucket_ids = np.full(n_buckets, -1, dtype=np.int64)
+        self.confusion = np.zeros((n_buckets, 4), dtype=np.int64)
+        self.counts = np.zeros(n_buckets, dtype=np.int64)
+        self.sums = np.zeros((n_buckets, n_features))
+        self.sumsq = np.zeros((n_buckets, n_features))
+        self.latest_bucket = -1
+        # Current batch: sorted row hashes already folded, and the TIME shift onto the window axis
+        self.batch_row_hashes = np.zeros(0, dtype=np.int64)
+        self.time_offset = 0.0
+        self.batches = 0
+        # Fingerprint of the batch table at the last update, so an unchanged table isn't re-read
+        self.batch_fingerprint = None
+
+    @classmethod
+    def from_reference(cls, ref, model, feature_cols, target="CLASS", model_id=None, **kwargs):
+        """Start an empty window whose thresholds are relative to the reference table."""
+        state = cls(feature_cols, model_id=model_id, **kwargs)
+        X = ref[state.drift_cols].to_numpy(dtype=float)
+        counts = confusion_counts(ref[target], model.predict(ref[feature_cols]))[0]
+        state.reference = {
+            "metrics": metrics_from_confusion(*counts),
+            "mean": np.nanmean(X, axis=0).tolist(),
+            "std": np.nanstd(X, axis=0).tolist(),
+        }
+        return state
+
+    def new_rows(self, row_hashes):
+        """Mask of rows not yet folded; identical rows are told apart by their occurrence count."""
+        row_hashes = np.asarray(row_hashes, dtype=np.int64)
+        order = np.argsort(row_hashes, kind="stable")
+        sorted_hashes = row_hashes[order]
+        group_start = np.searchsorted(sorted_hashes, sorted_hashes, side="left")
+        occurrence = np.empty(len(row_hashes), dtype=np.int64)
+        occurrence[order] = np.arange(len(row_hashes)) - group_start
+        seen = (np.searchsorted(self.batch_row_hashes, row_hashes, side="right")
+                - np.searchsorted(self.batch_row_hashes, row_hashes, side="left"))
+        return occurrence >= seen
+
+    def update(self, df, row_hashes, prediction_col="prediction", target="CLASS"):
+        """Fold the unseen rows of a scored batch table into the ring buffer.
+
+        row_hashes identifies each row (e.g. Snowflake HASH(*)). If the table
+        shares rows with the batch folded last time, only the rest is added
+        on the same TIME axis (an append); otherwise it is a new batch.
+        """
+        row_hashes = np.asarray(row_hashes, dtype=np.int64)
+        if len(row_hashes) and not np.isin(row_hashes, self.batch_row_hashes).any():
+            self._start_batch(df[self.time_col].to_numpy(dtype=float).min())
+        fresh = self.new_rows(row_hashes)
+        df, row_hashes = df[fresh], row_hashes[fresh]
+        self.batch_row_hashes = np.sort(np.concatenate([self.batch_row_hashes, row_hashes]))
+        if df.empty:
+            return 0
+
+        times = df[self.time_col].to_numpy(dtype=float) + self.time_offset
+        buckets = np.floor(times / self.bucket_seconds).astype(np.int64)
+        newest = max(self.latest_bucket, int(buckets.max()))
+        # Rows older than the window can never be read again
+        in_window = buckets > newest - self.n_buckets
+        df, buckets = df[in_window], buckets[in_window]
+
+        uniq, inv = np.unique(buckets, return_inverse=True)
+        X = np.nan_to_num(df[self.drift_cols].to_numpy(dtype=float))
+        conf = confusion_counts(df[target], df[prediction_col], inv, len(uniq))
+        counts = np.bincount(inv, minlength=len(uniq))
+        sums = np.column_stack([np.bincount(inv, weights=X[:, j], minlength=len(uniq)) for j in range(X.shape[1])])
+        sumsq = np.column_stack([np.bincount(inv, weights=X[:, j] ** 2, minlength=len(uniq)) for j in range(X.shape[1])])
+
+        for i, bucket in enumerate(uniq):
+            slot = bucket % self.n_buckets
+            if self.bucket_ids[slot] != bucket:
+                # Slot held an expired bucket: recycle it
+                self.bucket_ids[slot] = bucket
+                self.confusion[slot] = 0
+                self.counts[slot] = 0
+                self.sums[slot] = 0
+                self.sumsq[slot] = 0
+            self.confusion[slot] += conf[i]
+            self.counts[slot] += counts[i]
+            self.sums[slot] += sums[i]
+            self.sumsq[slot] += sumsq[i]
+
+        self.latest_bucket = newest
+        return int(fresh.sum())
+
+    def _start_batch(self, min_time):
+        """Shift a new batch so its first bucket follows the newest bucket of the previous one."""
+        if self.batches:
+            first_bucket = np.floor(min_time / self.bucket_seconds)
+            self.time_offset = float((self.latest_bucket + 1 - first_bucket) * self.bucket_seconds)
+        self.batch_row_hashes = np.zeros(0, dtype=np.int64)
+        self.batches += 1
+
+    def _live_slots(self):
+        return (self.bucket_ids >= 0) & (self.bucket_ids > self.latest_bucket - self.n_buckets)
+
+    def window_metrics(self):
+        live = self._live_slots()
+        tn, fp, fn, tp = self.confusion[live].sum(axis=0)
+        metrics = metrics_from_confusion(tn, fp, fn, tp)
+        metrics["Rows"] = int(self.counts[live].sum())
+        metrics["Positives"] = int(tp + fn)
+        return metrics
+
+    def window_feature_summary(self):
+        live = self._live_slots()
+        n = self.counts[live].sum()
+        if n == 0:
+            return pd.DataFrame(columns=["mean", "std"])
+        mean = self.sums[live].sum(axis=0) / n
+        var = np.maximum(self.sumsq[live].sum(axis=0) / n - mean ** 2, 0.0)
+        return pd.DataFrame({"mean": mean, "std": np.sqrt(var)}, index=self.drift_cols)
+
+    def drifted_features(self, effect_size=WINDOW_DRIFT_EFFECT_SIZE):
+        """Features whose windowed mean moved more than effect_size reference standard deviations."""
+        summary = self.window_feature_summary()
+        if summary.empty or not self.reference:
+            return []
+        ref_mean = np.asarray(self.reference["mean"])
+        ref_std = np.asarray(self.reference["std"])
+        shift = np.abs(summary["mean"].to_numpy() - ref_mean) / np.where(ref_std > 0, ref_std, 1.0)
+        return [f for f, s in zip(self.drift_cols, shift) if s > effect_size]
+
+    def retrain_decision(self):
+        """Return (decision, rationale, window metrics) from the current window."""
+        metrics = self.window_metrics()
+        window_desc = f"Window: {self.n_buckets} x {self.bucket_seconds}s, {metrics['Rows']} rows."
+        if metrics["Rows"] < WINDOW_MIN_ROWS or metrics["Positives"] < WINDOW_MIN_POSITIVES:
+            return "NO", f"Not enough data in window to decide. {window_desc}", metrics
+
+        ref_metrics = self.reference.get("metrics", {})
+        degraded = [k for k in DEGRADATION_METRICS
+                    if k in ref_metrics and ref_metrics[k] - metrics[k] > WINDOW_METRIC_DROP]
+        drifted = self.drifted_features()
+
+        reasons = []
+        if degraded:
+            reasons.append(f"Degraded metrics: {', '.join(degraded)}")
+        if len(drifted) > WINDOW_MAX_DRIFTED_FEATURES:
+            reasons.append(f"Drifted features: {', '.join(drifted)}")
+        threshold_desc = (f"Threshold: {WINDOW_METRIC_DROP:.0%} Degradation, "
+                          f">{WINDOW_MAX_DRIFTED_FEATURES} features over {WINDOW_DRIFT_EFFECT_SIZE} std shift.")
+        if reasons:
+            return "YES", f"{threshold_desc} {'; '.join(reasons)}. {window_desc}", metrics
+        return "NO", f"All windowed metrics within threshold. {threshold_desc} {window_desc}", metrics
+
+    def to_dict(self):
+        return {
+            "feature_cols": self.feature_cols,
+            "time_col": self.time_col,
+            "bucket_seconds": self.bucket_seconds,
+            "n_buckets": self.n_buckets,
+            "model_id": self.model_id,
+            "reference": self.reference,
+            "bucket_ids": self.bucket_ids.tolist(),
+            "confusion": self.confusion.tolist(),
+            "counts": self.counts.tolist(),
+            "sums": self.sums.tolist(),
+            "sumsq": self.sumsq.tolist(),
+            "latest_bucket": self.latest_bucket,
+            "batch_row_hashes": self.batch_row_hashes.tolist(),
+            "time_offset": self.time_offset,
+            "batches": self.batches,
+            "batch_fingerprint": self.batch_fingerprint,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        time_col = d.get("time_col", "TIME")
+        state = cls(d["feature_cols"], d["bucket_seconds"], d["n_buckets"], d["model_id"], d["reference"], time_col)
+        state.bucket_ids = np.asarray(d["bucket_ids"], dtype=np.int64)
+        state.confusion = np.asarray(d["confusion"], dtype=np.int64)
+        state.counts = np.asarray(d["counts"], dtype=np.int64)
+        state.sums = np.asarray(d["sums"], dtype=float)
+        state.sumsq = np.asarray(d["sumsq"], dtype=float)
+        if "time_col" not in d and time_col in state.feature_cols:
+            # States written before TIME was excluded carry its moments; drop them
+            keep = [i for i, c in enumerate(state.feature_cols) if c != time_col]
+            state.sums, state.sumsq = state.sums[:, keep], state.sumsq[:, keep]
+            for key in ("mean", "std"):
+                if key in state.reference:
+                    state.reference[key] = [state.reference[key][i] for i in keep]
+        state.latest_bucket = d["latest_bucket"]
+        # States written before batch tracking start their next table as a new batch
+        state.batch_row_hashes = np.asarray(d.get("batch_row_hashes", []), dtype=np.int64)
+        state.time_offset = d.get("time_offset", 0.0)
+        state.batches = d.get("batches", 1 if d["latest_bucket"] >= 0 else 0)
+        state.batch_fingerprint = d.get("batch_fingerprint")
+        return state
+
+
+def load_window_state(path=WINDOW_STATE_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return WindowMonitorState.from_dict(json.load(f))
+
+
+def save_window_state(state, path=WINDOW_STATE_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Write-then-rename so a crash never leaves a half-written state file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state.to_dict(), f)
+    os.replace(tmp_path, path)
@@ -0,0 +1,184 @@
+import argparse
+import io
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import joblib
+import mlflow
+import numpy as np
+import pandas as pd
+import snowflake.connector
+from mlflow.tracking import MlflowClient
+from window_monitor import confusion_counts, metrics_from_confusion
+
+# Snowflake credentials from environment variables
+account = os.getenv('SNOWFLAKE_ACCOUNT')
+user = os.getenv('SNOWFLAKE_USER')
+password = os.getenv('SNOWFLAKE_PASSWORD')
+warehouse = os.getenv('SNOWFLAKE_WAREHOUSE')
+database = os.getenv('SNOWFLAKE_DATABASE')
+schema = os.getenv('SNOWFLAKE_SCHEMA')
+
+MODEL_NAME = "CreditCardFraudModel"
+# Labelled data every version is scored against
+BACKTEST_TABLE = os.getenv('BACKTEST_TABLE', 'CREDITCARD.PUBLIC.CREDITCARD_BATCH_INPUTS')
+BACKTEST_CHUNK_ROWS = int(os.getenv('BACKTEST_CHUNK_ROWS', '100000'))
+# Width of the per-slice breakdown over the TIME column (default one day)
+BACKTEST_SLICE_SECONDS = int(os.getenv('BACKTEST_SLICE_SECONDS', '86400'))
+
+# Report metrics under the names championselection.py compares on
+METRIC_NAMES = {
+    "Accuracy": "Accuracy",
+    "Precision": "Precision",
+    "Recall": "Recall",
+    "F1_Score": "F1 Score",
+    "MatthewsCorrcoef": "Matthews Corrcoef",
+}
+
+
+def load_registry_models(client, versions):
+    """Download and unpickle each registry version once."""
+    models = {}
+    for version in versions:
+        mv = client.get_model_version(name=MODEL_NAME, version=version)
+        local_model_path = mlflow.artifacts.download_artifacts(f"runs:/{mv.run_id}/model")
+        models[str(version)] = joblib.load(os.path.join(local_model_path, "model.pkl"))
+        print(f"📥 Loaded version {version} (run {mv.run_id})")
+    return models
+
+
+def iter_snowflake_chunks(table=BACKTEST_TABLE):
+    """Stream the table as Arrow-backed pandas batches instead of one fetch_pandas_all()."""
+    conn = snowflake.connector.connect(
+        user=user, password=password,
+        account=account, warehouse=warehouse,
+        database=database, schema=schema
+    )
+    try:
+        cur = conn.cursor()
+        cur.execute(f"SELECT * FROM {table} ORDER BY TIME")
+        for batch in cur.fetch_pandas_batches():
+            yield batch
+    finally:
+        conn.close()
+
+
+def iter_csv_chunks(path, chunk_rows=BACKTEST_CHUNK_ROWS):
+    for chunk in pd.read_csv(path, chunksize=chunk_rows):
+        chunk.columns = [c.upper() for c in chunk.columns]
+        yield chunk
+
+
+def score_chunk(model, X):
+    # Thread CPU time, so concurrent versions don't inflate each other's scoring cost
+    start = time.thread_time()
+    # One forest pass: predict() is argmax of predict_proba()
+    probs = model.predict_proba(X)
+    preds = model.classes_[probs.argmax(axis=1)]
+    return preds, time.thread_time() - start
+
+
+def run_backtest(models, chunks, target="CLASS", time_col="TIME", slice_seconds=BACKTEST_SLICE_SECONDS, workers=None):
+    """Score every chunk with every model in parallel, reading the data once.
+
+    Returns (summary, slices): one row of metrics and scoring cost per
+    version, and one row per version and TIME slice.
+    """
+    first_model = next(iter(models.values()))
+    feature_cols = getattr(first_model, "feature_names_in_", None)
+    confusion = {}          # (version, slice) -> [tn, fp, fn, tp]
+    cost = {version: 0.0 for version in models}
+    rows = 0
+
+    with ThreadPoolExecutor(max_workers=workers or len(models)) as pool:
+        for chunk in chunks:
+            if feature_cols is None:
+                feature_cols = [c for c in chunk.columns if c not in ['ID', target, 'PREDICTION', 'PREDICTION_PROB']]
+            X = chunk[list(feature_cols)].apply(pd.to_numeric, errors='coerce')
+            y = chunk[target].to_numpy(dtype=np.int64)
+            slices, inv = np.unique(
+                np.floor(chunk[time_col].to_numpy(dtype=float) / slice_seconds).astype(np.int64), return_inverse=True
+            )
+
+            # Tree traversal releases the GIL, so model threads score the chunk concurrently
+            futures = {version: pool.submit(score_chunk, model, X) for version, model in models.items()}
+            for version, future in futures.items():
+                preds, seconds = future.result()
+                cost[version] += seconds
+                for slice_id, counts in zip(slices, confusion_counts(y, preds, inv, len(slices))):
+                    confusion[(version, slice_id)] = confusion.get((version, slice_id), 0) + counts
+            rows += len(chunk)
+            print(f"⏩ Scored {rows} rows with {len(models)} versions")
+
+    slice_records = []
+    for (version, slice_id), counts in sorted(confusion.items()):
+        metrics = metrics_from_confusion(*counts)
+        slice_records.append({
+            "Version": version,
+            "Slice Start": slice_id * slice_seconds,
+            "Rows": int(counts.sum()),
+            **{METRIC_NAMES[k]: v for k, v in metrics.items()},
+        })
+    slices_df = pd.DataFrame(slice_records)
+
+    summary_records = []
+    for version in models:
+        counts = sum((c for (v, _), c in confusion.items() if v == version), np.zeros(4, dtype=np.int64))
+        metrics = metrics_from_confusion(*counts)
+        summary_records.append({
+            "Version": version,
+            **{METRIC_NAMES[k]: v for k, v in metrics.items()},
+            "Rows": rows,
+            "Scoring CPU Seconds": cost[version],
+            "Rows Per Second": rows / cost[version] if cost[version] else float('nan'),
+        })
+    summary_df = pd.DataFrame(summary_records).set_index("Version")
+    return summary_df, slices_df
+
+
+def backtest_versions(client, versions, chunks=None, workers=None):
+    """Backtest registry versions on BACKTEST_TABLE (or the given chunks)."""
+    models = load_registry_models(client, versions)
+    return run_backtest(models, chunks if chunks is not None else iter_snowflake_chunks(), workers=workers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=f"Score {MODEL_NAME} registry versions side by side in one data pass.")
+    parser.add_argument('--versions', nargs='+', help="Registry versions to compare (default: all)")
+    parser.add_argument('--csv', help=f"Labelled CSV to stream instead of {BACKTEST_TABLE}")
+    parser.add_argument('--workers', type=int, help="Parallel model workers (default: one per version)")
+    parser.add_argument('--output', default="backtest_results.csv", help="Summary CSV path")
+    args = parser.parse_args()
+
+    mlflow.set_tracking_uri(os.getenv("MLFLOW_TRACKING_URI", "http://127.0.0.1:5000"))
+    client = MlflowClient()
+    versions = args.versions or sorted(
+        (v.version for v in client.search_model_versions(f"name='{MODEL_NAME}'")), key=int
+    )
+
+    chunks = iter_csv_chunks(args.csv) if args.csv else None
+    summary, slices = backtest_versions(client, versions, chunks, args.workers)
+
+    pd.set_option("display.width", 200)
+    print("\n📊 Backtest summary:")
+    print(summary.to_string(float_format=lambda v: f"{v:.4f}"))
+    summary.to_csv(args.output)
+    slices_path = args.output.replace(".csv", "_slices.csv")
+    slices.to_csv(slices_path, index=False)
+    print(f"✅ Results saved to {args.output} and {slices_path}")
+
+    mlflow.set_experiment("Backtest_Experiments_V1")
+    with mlflow.start_run(run_name="Backtest"):
+        for version, row in summary.iterrows():
+            for metric, value in row.items():
+                mlflow.log_metric(f"v{version}_{metric.replace(' ', '_')}", value)
+        mlflow.log_artifact(args.output)
+        mlflow.log_artifact(slices_path)
+        mlflow.set_tag("Versions", ",".join(versions))
+
+
+if __name__ == "__main__":
+    # Fix Windows stdout encoding issue (only when run directly; importers already wrap stdout)
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    main()
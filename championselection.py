@@ -5,6 +5,9 @@ import io
 import snowflake.connector
 import os
 import shutil
+import json
+from backtest import backtest_versions, BACKTEST_TABLE
+from fingerprint import StageFingerprint, table_fingerprints, file_fingerprints
 
 
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
@@ -18,6 +21,16 @@ warehouse = os.getenv('SNOWFLAKE_WAREHOUSE')
 # Define the metrics that challenger must beat champion on to become champion
 METRICS_TO_COMPARE = ['Accuracy', 'Precision', 'Recall', 'F1 Score', 'Matthews Corrcoef']
 
+# Serving cost metrics logged by register_model.py (lower is better)
+PERF_METRICS_TO_COMPARE = ['Model Size MB', 'Load Time Seconds', 'Latency P50 ms', 'Latency P99 ms']
+
+# Challenger may not be slower than champion by more than this factor on p99 latency
+MAX_LATENCY_REGRESSION = float(os.getenv('MAX_LATENCY_REGRESSION', '1.5'))
+
+# "backtest" scores challenger and champion on the same labelled data in one pass;
+# "training" compares the holdout metrics each version logged at registration
+SELECTION_METRICS_SOURCE = os.getenv('SELECTION_METRICS_SOURCE', 'backtest')
+
 def copy_reference_table():
     print("\n📤 Copying reference dataset in Snowflake...")
     conn = snowflake.connector.connect(
@@ -70,6 +83,15 @@ def better_than(metrics_a, metrics_b):
     # challenger must be better on > half of the metrics
     return better_count > len(METRICS_TO_COMPARE) / 2
 
+def within_latency_budget(challenger_metrics, champion_metrics):
+    """Return False if the challenger's p99 latency regresses too far past the champion's."""
+    challenger_p99 = challenger_metrics.get('Latency P99 ms')
+    champion_p99 = champion_metrics.get('Latency P99 ms')
+    # Versions registered before the performance gate have no latency to compare
+    if challenger_p99 is None or champion_p99 is None:
+        return True
+    return challenger_p99 <= champion_p99 * MAX_LATENCY_REGRESSION
+
 def main():
     mlflow.set_tracking_uri("http://127.0.0.1:5000")
     client = MlflowClient()
@@ -99,17 +121,31 @@ def main():
 
     challenger_metrics = get_model_version_metrics(client, model_name, challenger_version.version)
     champion_metrics = get_model_version_metrics(client, model_name, champion_version.version)
+
+    metrics_source = SELECTION_METRICS_SOURCE
+    if SELECTION_METRICS_SOURCE == 'backtest':
+        print("\n⏩ Backtesting challenger and champion on the same evaluation data...")
+        summary, _ = backtest_versions(client, [challenger_version.version, champion_version.version])
+        if summary["Rows"].max() == 0:
+            print(f"⚠️ Backtest table {BACKTEST_TABLE} is empty; comparing training metrics instead.")
+            metrics_source = 'training'
+        else:
+            # Backtest metrics replace training-time ones; registration perf metrics are kept
+            challenger_metrics = {**challenger_metrics, **summary.loc[str(challenger_version.version)].to_dict()}
+            champion_metrics = {**champion_metrics, **summary.loc[str(champion_version.version)].to_dict()}
     
     # Print metrics side-by-side
-    print("\n📊 Metrics Comparison:")
+    print(f"\n📊 Metrics Comparison ({metrics_source}):")
     print(f"{'Metric':<20} {'Challenger':<15} {'Champion':<15}")
     print("-" * 50)
-    for metric in METRICS_TO_COMPARE:
+    for metric in METRICS_TO_COMPARE + PERF_METRICS_TO_COMPARE:
         challenger_val = challenger_metrics.get(metric, 'N/A')
         champion_val = champion_metrics.get(metric, 'N/A')
         print(f"{metric:<20} {str(challenger_val):<15} {str(champion_val):<15}")
 
-    if better_than(challenger_metrics, champion_metrics):
+    if not within_latency_budget(challenger_metrics, champion_metrics):
+        print(f"⚠️ Challenger version {challenger_version.version} exceeds {MAX_LATENCY_REGRESSION}x champion p99 latency. No changes made.")
+    elif better_than(challenger_metrics, champion_metrics):
         print(f"🚀 Challenger version {challenger_version.version} is better than champion version {champion_version.version}. Promoting challenger.")
         # Archive old champion by tag update
         client.set_model_version_tag(model_name, champion_version.version, "status", "archived")
@@ -147,9 +183,56 @@ def export_current_champion_model(model_name: str):
         raise FileNotFoundError("Champion model.pkl not found in artifacts.")
 
     shutil.copy(model_file, "champion_model.pkl")
+    # Record which registry version the local pickle is, for prediction logs and serving
+    with open("champion_model.json", "w") as f:
+        json.dump({"version": champion_version.version, "run_id": run_id}, f, indent=4)
     print("✅ Champion model saved as champion_model.pkl.")
 
+    # Export the cascade pre-filter registered with this version, if any
+    if champion_version.tags.get("cascade") == "true":
+        for artifact, local_name in [("prefilter_model.pkl", "champion_prefilter.pkl"), ("cascade.json", "champion_cascade.json")]:
+            local_file = mlflow.artifacts.download_artifacts(f"runs:/{run_id}/{artifact}")
+            shutil.copy(local_file, local_name)
+        print("✅ Champion cascade saved as champion_prefilter.pkl and champion_cascade.json.")
+    else:
+        # Don't leave a stale pre-filter next to a new champion
+        for local_name in ["champion_prefilter.pkl", "champion_cascade.json"]:
+            if os.path.exists(local_name):
+                os.remove(local_name)
+
+def selection_fingerprint(model_name: str):
+    """Selection inputs: registered versions, the backtest table fingerprint and the selection config."""
+    mlflow.set_tracking_uri("http://127.0.0.1:5000")
+    client = MlflowClient()
+    # Tags too: retagging an older version as production (a rollback) must re-export the champion
+    versions = sorted(
+        ([mv.version, mv.run_id, mv.tags.get("status"), mv.tags.get("role")]
+         for mv in get_model_versions(client, model_name)),
+        key=lambda v: int(v[0])
+    )
+    tables = {}
+    if SELECTION_METRICS_SOURCE == 'backtest':
+        conn = snowflake.connector.connect(user=user, password=password, account=account, warehouse=warehouse)
+        tables = table_fingerprints(conn, [BACKTEST_TABLE])
+        conn.close()
+    inputs = {
+        "versions": versions,
+        "tables": tables,
+        "code": file_fingerprints(["championselection.py", "backtest.py"]),
+        "config": {
+            "SELECTION_METRICS_SOURCE": SELECTION_METRICS_SOURCE,
+            "MAX_LATENCY_REGRESSION": MAX_LATENCY_REGRESSION,
+        },
+    }
+    return StageFingerprint("champion_selection", inputs, ["champion_model.pkl", "champion_model.json"])
+
 if __name__ == "__main__":
-    main()
-    export_current_champion_model("CreditCardFraudModel")
+    # No new version and no new backtest data: the exported champion is still current
+    fingerprint = selection_fingerprint("CreditCardFraudModel")
+    if fingerprint.unchanged():
+        fingerprint.skip()
+    else:
+        main()
+        export_current_champion_model("CreditCardFraudModel")
+        fingerprint.record()
     
\ No newline at end of file
@@ -0,0 +1,348 @@
+import argparse
+import http.client
+import io
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+import numpy as np
+import pandas as pd
+
+FEATURE_COLUMNS = ['TIME'] + [f'V{i}' for i in range(1, 29)] + ['AMOUNT']
+CLK_TCK = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+def load_replay_bodies(path, batch_size):
+    """Request bodies from a JSONL file: one /predict body ({"records": [...]}) or one transaction per line."""
+    bodies, records = [], []
+    with open(path, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if isinstance(item, dict) and "records" in item:
+                bodies.append(item)
+            else:
+                # Same key normalisation as load_csv_bodies: CREDITCARD's Time/Amount are TIME/AMOUNT to the model
+                records.append({k.upper(): v for k, v in item.items()})
+    bodies += [{"records": records[i:i + batch_size]} for i in range(0, len(records), batch_size)]
+    return [json.dumps(b).encode("utf-8") for b in bodies]
+
+
+def load_csv_bodies(path, batch_size):
+    """Request bodies from recorded transactions in the CREDITCARD schema (labels and IDs dropped)."""
+    df = pd.read_csv(path)
+    df.columns = [c.upper() for c in df.columns]
+    return frame_to_bodies(df[FEATURE_COLUMNS], batch_size)
+
+
+def synthetic_bodies(n_rows, batch_size, seed=42):
+    """Transactions shaped like CREDITCARD: TIME over two days, PCA features ~N(0,1), log-normal AMOUNT."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.normal(size=(n_rows, 28)), columns=FEATURE_COLUMNS[1:-1])
+    df.insert(0, 'TIME', np.sort(rng.uniform(0, 172800, n_rows)).round())
+    df['AMOUNT'] = rng.lognormal(3.0, 1.5, n_rows).round(2)
+    return frame_to_bodies(df, batch_size)
+
+
+def frame_to_bodies(df, batch_size):
+    records = df.to_dict(orient="records")
+    return [json.dumps({"records": records[i:i + batch_size]}).encode("utf-8")
+            for i in range(0, len(records), batch_size)]
+
+
+class ScoringClient:
+    """One keep-alive connection per thread, reopened after errors or server-side closes."""
+
+    def __init__(self, url, timeout):
+        parsed = urlparse(url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.path = parsed.path if parsed.path not in ("", "/") else "/predict"
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def post(self, body):
+        """Send one request; returns the HTTP status, or None on a connection error or timeout."""
+        conn = self._conn()
+        try:
+            conn.request("POST", self.path, body, {"Content-Type": "application/json"})
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self._local.conn = None
+            return None
+
+    def get_json(self, path):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            conn.request("GET", path)
+            return json.loads(conn.getresponse().read())
+        finally:
+            conn.close()
+
+
+class ProcessSampler:
+    """Sample CPU and RSS of a local server's process tree from /proc while the load runs.
+
+    RSS is summed over the parent and its workers, so copy-on-write pages
+    shared between them are counted once per process.
+    """
+
+    def __init__(self, root_pid, interval=0.5):
+        self.root_pid = root_pid
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _tree(self):
+        pids, stack = [], [self.root_pid]
+        while stack:
+            pid = stack.pop()
+            pids.append(pid)
+            try:
+                with open(f"/proc/{pid}/task/{pid}/children", "r") as f:
+                    stack.extend(int(p) for p in f.read().split())
+            except OSError:
+                pass
+        return pids
+
+    def _read(self):
+        cpu_ticks, rss_kb = 0, 0
+        for pid in self._tree():
+            try:
+                with open(f"/proc/{pid}/stat", "r") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+                cpu_ticks += int(fields[11]) + int(fields[12])  # utime + stime
+                with open(f"/proc/{pid}/status", "r") as f:
+                    rss_kb += next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+            except (OSError, StopIteration):
+                continue  # Worker exited between listing and reading
+        return time.monotonic(), cpu_ticks / CLK_TCK, rss_kb / 1024
+
+    def _run(self):
+        previous = self._read()
+        while not self._stop.wait(self.interval):
+            current = self._read()
+            wall = current[0] - previous[0]
+            self.samples.append({"cpu_percent": 100 * (current[1] - previous[1]) / wall, "rss_mb": current[2]})
+            previous = current
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        if not self.samples:
+            return {}
+        cpu = np.array([s["cpu_percent"] for s in self.samples])
+        rss = np.array([s["rss_mb"] for s in self.samples])
+        return {
+            "pid": self.root_pid,
+            "processes": len(self._tree()),
+            "cpu_percent_mean": float(cpu.mean()),
+            "cpu_percent_max": float(cpu.max()),
+            "rss_mb_mean": float(rss.mean()),
+            "rss_mb_max": float(rss.max()),
+        }
+
+
+def is_serve_process(pid):
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return b"serve.py" in f.read()
+    except (OSError, TypeError):
+        return False
+
+
+def find_server_root(worker_pid):
+    """The pre-fork parent of the worker that answered /health, if the server runs on this machine.
+
+    A pid reported from inside a container means nothing on the host, so
+    it is only trusted when the local process really is serve.py.
+    """
+    if not is_serve_process(worker_pid):
+        return None
+    with open(f"/proc/{worker_pid}/stat", "r") as f:
+        ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+    return ppid if is_serve_process(ppid) else worker_pid
+
+
+def run_closed_loop(client, bodies, concurrency, duration):
+    """Each of `concurrency` clients sends its next request as soon as the previous one returns."""
+    results = []
+    deadline = time.monotonic() + duration
+
+    def worker(i):
+        n, local = i, []
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            status = client.post(bodies[n % len(bodies)])
+            local.append((time.perf_counter() - start, status))
+            n += concurrency
+        results.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def run_open_loop(client, bodies, qps, duration, max_in_flight):
+    """Send at a fixed arrival rate regardless of responses.
+
+    Latency is measured from each request's scheduled send time, so time
+    spent queued behind a saturated server counts (no coordinated omission).
+    """
+    results = []
+    lock = threading.Lock()
+    start = time.perf_counter()
+
+    def send(i, scheduled):
+        status = client.post(bodies[i % len(bodies)])
+        with lock:
+            results.append((time.perf_counter() - scheduled, status))
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        for i in range(int(qps * duration)):
+            scheduled = start + i / qps
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, i, scheduled)
+    return results
+
+
+def summarize(results, elapsed):
+    latencies_ms = np.array([latency for latency, status in results if status == 200]) * 1000
+    statuses = {}
+    for _, status in results:
+        key = str(status) if status is not None else "connection_error"
+        statuses[key] = statuses.get(key, 0) + 1
+    errors = len(results) - len(latencies_ms)
+    summary = {
+        "requests": len(results),
+        "errors": errors,
+        "error_rate": errors / len(results) if results else float("nan"),
+        "status_counts": statuses,
+        "elapsed_seconds": elapsed,
+        "throughput_rps": len(latencies_ms) / elapsed if elapsed else float("nan"),
+    }
+    for name, q in [("p50", 50), ("p95", 95), ("p99", 99)]:
+        summary[f"latency_{name}_ms"] = float(np.percentile(latencies_ms, q)) if len(latencies_ms) else float("nan")
+    summary["latency_max_ms"] = float(latencies_ms.max()) if len(latencies_ms) else float("nan")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay transactions against the scoring server and measure latency under load.")
+    parser.add_argument('--url', default="http://127.0.0.1:8080/predict", help="Scoring endpoint")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--replay', help="JSONL of recorded request bodies or transactions")
+    source.add_argument('--csv', help="CSV of transactions in the CREDITCARD schema")
+    parser.add_argument('--synthetic-rows', type=int, default=10000, help="Synthetic transactions when no file is given")
+    parser.add_argument('--batch-size', type=int, default=1, help="Transactions per request")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--qps', type=float, help="Open loop: target requests per second")
+    mode.add_argument('--concurrency', type=int, default=8, help="Closed loop: concurrent clients")
+    parser.add_argument('--max-in-flight', type=int, default=64, help="Open loop: cap on outstanding requests")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds of measured load")
+    parser.add_argument('--warmup', type=float, default=3, help="Seconds of unmeasured load first")
+    parser.add_argument('--timeout', type=float, default=10, help="Per-request timeout in seconds")
+    parser.add_argument('--server-pid', type=int, help="Server process to sample (default: found via /health)")
+    parser.add_argument('--label', default="", help="Free-form tag for the run, e.g. the worker count")
+    parser.add_argument('--output', default="loadtest_results.json")
+    args = parser.parse_args()
+
+    if args.replay:
+        bodies = load_replay_bodies(args.replay, args.batch_size)
+        source_name = args.replay
+    elif args.csv:
+        bodies = load_csv_bodies(args.csv, args.batch_size)
+        source_name = args.csv
+    else:
+        bodies = synthetic_bodies(args.synthetic_rows, args.batch_size)
+        source_name = "synthetic"
+    print(f"📦 {len(bodies)} request bodies from {source_name} ({args.batch_size} transactions each)")
+
+    client = ScoringClient(args.url, args.timeout)
+    health_url = f"http://{client.host}:{client.port}"
+    try:
+        health = client.get_json("/health")
+    except OSError as e:
+        print(f"❌ No scoring server at {health_url}: {e}")
+        return
+    except ValueError as e:
+        print(f"❌ {health_url}/health did not return JSON; is this the scoring server? ({e})")
+        return
+    print(f"🎯 {health_url} is serving model version {health.get('model_version')}")
+    server_pid = args.server_pid or find_server_root(health.get("pid"))
+
+    def load(duration):
+        if args.qps:
+            return run_open_loop(client, bodies, args.qps, duration, args.max_in_flight)
+        return run_closed_loop(client, bodies, args.concurrency, duration)
+
+    if args.warmup > 0:
+        load(args.warmup)
+
+    sampler = ProcessSampler(server_pid) if server_pid and os.path.exists(f"/proc/{server_pid}") else None
+    if sampler:
+        sampler.start()
+    start = time.perf_counter()
+    results = load(args.duration)
+    elapsed = time.perf_counter() - start
+    server = sampler.stop() if sampler else {}
+
+    summary = summarize(results, elapsed)
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "label": args.label,
+        "url": args.url,
+        "model_version": health.get("model_version"),
+        "source": source_name,
+        "batch_size": args.batch_size,
+        "mode": "open_loop" if args.qps else "closed_loop",
+        "target_qps": args.qps,
+        "concurrency": None if args.qps else args.concurrency,
+        "duration_seconds": args.duration,
+        **summary,
+        "server": server,
+    }
+
+    print(f"\n📊 {report['mode']} load test ({report['requests']} requests in {elapsed:.1f}s):")
+    print(f"Throughput: {summary['throughput_rps']:.1f} req/s"
+          + (f" (target {args.qps:g})" if args.qps else f" at concurrency {args.concurrency}"))
+    print(f"Latency ms: p50 {summary['latency_p50_ms']:.1f}, p95 {summary['latency_p95_ms']:.1f}, "
+          f"p99 {summary['latency_p99_ms']:.1f}, max {summary['latency_max_ms']:.1f}")
+    print(f"Error rate: {summary['error_rate']:.2%} {summary['status_counts']}")
+    if server:
+        print(f"Server ({server['processes']} processes): CPU {server['cpu_percent_mean']:.0f}% mean / "
+              f"{server['cpu_percent_max']:.0f}% max, RSS {server['rss_mb_mean']:.0f} MB mean / {server['rss_mb_max']:.0f} MB max")
+    else:
+        print("ℹ️ Server is not a local process; CPU/RSS not sampled.")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"✅ Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    # Fix Windows stdout encoding issue
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    main()
@@ -2,9 +2,14 @@ import mlflow
 import mlflow.sklearn
 import json
 import joblib
+import os
 import sys
 import io
+import time
+import numpy as np
+import pandas as pd
 from mlflow.tracking import MlflowClient
+from fingerprint import FORCE_RERUN, file_fingerprints, inputs_digest, write_github_output
 
 # Fix Windows stdout encoding issue
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
@@ -13,9 +18,24 @@ sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 mlflow.set_tracking_uri("http://127.0.0.1:5000/")
 mlflow.set_experiment("CreditCard_Fraud_Detection_V1")
 
-# Load the trained model
+register_start = time.perf_counter()
 model_path = "model.pkl"
+
+# Skip when this exact model.pkl + metrics.json is already a registered version
+artifact_sha256 = inputs_digest(file_fingerprints([model_path, "metrics.json"]))
+if not FORCE_RERUN:
+    for mv in MlflowClient().search_model_versions("name='CreditCardFraudModel'"):
+        if mv.tags.get("artifact_sha256") == artifact_sha256:
+            saved = float(mv.tags.get("register_seconds", 0))
+            print(f"⏭️ model.pkl and metrics.json already registered as version {mv.version}; "
+                  f"skipped ~{saved:.1f}s of load, test and benchmark compute.")
+            write_github_output(skipped=True)
+            sys.exit(0)
+
+# Load the trained model
+load_start = time.perf_counter()
 model = joblib.load(model_path)
+load_time_s = time.perf_counter() - load_start
 
 # Load evaluation metrics
 with open("metrics.json", "r") as f:
@@ -42,9 +62,75 @@ def tests_pass(metrics, thresholds):
             return False
     return True
 
+# Define performance budgets for the scoring SLA (override via environment variables)
+perf_budgets = {
+    'Model Size MB': float(os.getenv('PERF_MAX_MODEL_SIZE_MB', '200')),
+    'Load Time Seconds': float(os.getenv('PERF_MAX_LOAD_TIME_S', '10')),
+    'Latency P50 ms': float(os.getenv('PERF_MAX_LATENCY_P50_MS', '50')),
+    'Latency P99 ms': float(os.getenv('PERF_MAX_LATENCY_P99_MS', '150')),
+}
+# Throughput is the only budget where higher is better
+min_batch_rows_per_sec = float(os.getenv('PERF_MIN_BATCH_ROWS_PER_SEC', '5000'))
+
+def make_synthetic_batch(model, n_rows, seed=42):
+    """Build a random feature frame shaped like the model's training input."""
+    rng = np.random.default_rng(seed)
+    columns = getattr(model, "feature_names_in_", None)
+    if columns is None:
+        columns = [f"f{i}" for i in range(model.n_features_in_)]
+    return pd.DataFrame(rng.normal(size=(n_rows, len(columns))), columns=list(columns))
+
+def benchmark_model(model, model_path, load_time_s, n_single=200, n_batch=10000):
+    """Measure size, load time, single-row latency and batch throughput of a candidate model."""
+    batch = make_synthetic_batch(model, n_batch)
+
+    # Warm up once so one-off allocation costs don't land in the percentiles
+    model.predict_proba(batch.iloc[:1])
+
+    single_latencies_ms = []
+    for i in range(n_single):
+        row = batch.iloc[[i % n_batch]]
+        start = time.perf_counter()
+        model.predict_proba(row)
+        single_latencies_ms.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    model.predict_proba(batch)
+    batch_time_s = time.perf_counter() - start
+
+    return {
+        'Model Size MB': os.path.getsize(model_path) / (1024 * 1024),
+        'Load Time Seconds': load_time_s,
+        'Latency P50 ms': float(np.percentile(single_latencies_ms, 50)),
+        'Latency P99 ms': float(np.percentile(single_latencies_ms, 99)),
+        'Batch Rows Per Second': n_batch / batch_time_s,
+    }
+
+# Function to check if performance numbers fit the budgets
+def perf_pass(perf, budgets, min_rows_per_sec):
+    for metric, budget in budgets.items():
+        value = perf[metric]
+        if value > budget:
+            print(f"❌ Performance gate failed: {metric} = {value:.4f} > budget {budget}")
+            return False
+    if perf['Batch Rows Per Second'] < min_rows_per_sec:
+        print(f"❌ Performance gate failed: Batch Rows Per Second = {perf['Batch Rows Per Second']:.1f} < budget {min_rows_per_sec}")
+        return False
+    return True
+
+# Benchmark the candidate before logging
+perf = benchmark_model(
+    model, model_path, load_time_s,
+    n_single=int(os.getenv('PERF_SINGLE_ROW_ITERATIONS', '200')),
+    n_batch=int(os.getenv('PERF_BATCH_ROWS', '10000'))
+)
+print("\n⏱️ Model Performance Benchmark:")
+for metric, value in perf.items():
+    print(f"{metric}: {value:.4f}")
+
 # Run tests before logging
-if tests_pass(metrics, test_thresholds):
-    print("✅ All tests passed. Proceeding with model logging and registration...")
+if tests_pass(metrics, test_thresholds) and perf_pass(perf, perf_budgets, min_batch_rows_per_sec):
+    print("✅ All tests and performance budgets passed. Proceeding with model logging and registration...")
 
     with mlflow.start_run(run_name="Model Logging") as run:
         # Log model artifact and register it
@@ -58,10 +144,20 @@ if tests_pass(metrics, test_thresholds):
         for metric_name, value in metrics.items():
             mlflow.log_metric(metric_name, value)
 
+        # Log performance benchmark so champion selection can weigh cost
+        for metric_name, value in perf.items():
+            mlflow.log_metric(metric_name, value)
+
         # Log files as artifacts (optional)
         mlflow.log_artifact("metrics.json")
         mlflow.log_artifact("model.pkl")
 
+        # Version the cascade pre-filter together with the forest it guards
+        has_cascade = os.path.exists("prefilter_model.pkl") and os.path.exists("cascade.json")
+        if has_cascade:
+            mlflow.log_artifact("prefilter_model.pkl")
+            mlflow.log_artifact("cascade.json")
+
         print(f"\n✅ Model logged and registered in MLflow as 'CreditCardFraudModel'")
         print(f"   Run ID: {run.info.run_id}")
         print(f"🏃 View run Model Logging at: http://127.0.0.1:5000/#/experiments/{run.info.experiment_id}/runs/{run.info.run_id}")
@@ -94,7 +190,18 @@ if tests_pass(metrics, test_thresholds):
             value="staging"
         )
 
+        client.set_model_version_tag(
+            name=model_name,
+            version=model_version,
+            key="cascade",
+            value=str(has_cascade).lower()
+        )
+
+        # Lets a rerun on the same artifacts skip registration
+        client.set_model_version_tag(model_name, model_version, "artifact_sha256", artifact_sha256)
+        client.set_model_version_tag(model_name, model_version, "register_seconds", f"{time.perf_counter() - register_start:.1f}")
+
         print(f"🚀 Model version {model_version} tagged as 'challenger' and status 'staging'")
 
 else:
-    print("❌ Model failed the evaluation tests and will NOT be logged or registered.")
+    print("❌ Model failed the evaluation tests or performance budgets and will NOT be logged or registered.")
@@ -0,0 +1,41 @@
+import glob
+import os
+import sys
+import threading
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prediction_log import PredictionLogWriter, read_prediction_logs
+
+
+def test_failed_flush_is_dead_lettered_and_writer_keeps_running(tmp_path):
+    writer = PredictionLogWriter(str(tmp_path), max_rows=2, max_seconds=60, max_buffered=2)
+    # Mixed types in one column: pyarrow refuses to write the batch
+    writer.log({"V1": "0.5"}, 0.1, 0, "1", 1.0)
+    writer.log({"V1": 1.0}, 0.2, 0, "1", 1.0)
+
+    # The buffer bound is hit by the failed batch; log() must not block on it forever
+    done = threading.Event()
+
+    def log_more():
+        writer.log({"V1": 2.0}, 0.3, 0, "1", 1.0)
+        done.set()
+
+    threading.Thread(target=log_more, daemon=True).start()
+    assert done.wait(10)
+
+    with pytest.raises(RuntimeError, match="2 prediction log rows"):
+        writer.close()
+    assert writer.rows_failed == 2
+    assert len(glob.glob(os.path.join(str(tmp_path), "dead_letter", "*.pkl"))) == 1
+    # Rows after the failure are still written
+    assert writer.rows_written == 1
+    assert read_prediction_logs(str(tmp_path))["V1"].tolist() == [2.0]
+
+
+def test_close_flushes_buffered_rows(tmp_path):
+    with PredictionLogWriter(str(tmp_path), max_rows=100, max_seconds=60) as writer:
+        writer.log_batch(pd.DataFrame({"V1": [1.0, 2.0], "PREDICTION": [0, 1], "PREDICTION_PROB": [0.1, 0.9]}), "1", 3.0)
+    assert writer.rows_written == 2 and writer.rows_failed == 0
+    assert len(read_prediction_logs(str(tmp_path))) == 2
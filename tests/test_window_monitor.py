@@ -0,0 +1,76 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from window_monitor import WindowMonitorState
+
+
+def make_batch(times, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({"TIME": np.asarray(times, dtype=float), "V1": rng.normal(size=len(times))})
+    df["CLASS"] = 0
+    df["prediction"] = 0
+    # Stand-in for Snowflake HASH(*): one hash per distinct row
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy().view(np.int64)
+    return df, row_hashes
+
+
+def test_rows_tied_with_previous_max_time_are_folded():
+    state = WindowMonitorState(["V1"], bucket_seconds=10, n_buckets=24)
+    df, hashes = make_batch([0, 5, 10, 10])
+    assert state.update(df, hashes) == 4
+
+    # Same table with rows appended, one tied on the last TIME
+    appended, appended_hashes = make_batch([10, 11], seed=1)
+    df = pd.concat([df, appended], ignore_index=True)
+    hashes = np.concatenate([hashes, appended_hashes])
+    assert state.update(df, hashes) == 2
+    assert state.window_metrics()["Rows"] == 6
+
+    # Re-reading the unchanged table folds nothing
+    assert state.update(df, hashes) == 0
+    assert state.window_metrics()["Rows"] == 6
+
+
+def test_reloaded_batch_with_restarted_time_starts_after_previous_batch():
+    state = WindowMonitorState(["V1"], bucket_seconds=10, n_buckets=24)
+    df, hashes = make_batch([0, 5, 10, 10])
+    state.update(df, hashes)
+    newest = state.latest_bucket
+
+    # A reloaded table whose TIME starts again at 0
+    df, hashes = make_batch([0, 1, 2], seed=2)
+    assert state.update(df, hashes) == 3
+    assert state.batches == 2
+    assert state.latest_bucket == newest + 1
+    assert state.window_metrics()["Rows"] == 7
+
+
+def test_state_round_trip_keeps_batch_progress():
+    state = WindowMonitorState(["V1"], bucket_seconds=10, n_buckets=24)
+    df, hashes = make_batch([0, 5, 10, 10])
+    state.update(df, hashes)
+    restored = WindowMonitorState.from_dict(state.to_dict())
+    assert restored.update(df, hashes) == 0
+    assert restored.window_metrics()["Rows"] == 4
+
+
+class ConstantModel:
+    def predict(self, X):
+        return np.zeros(len(X), dtype=np.int64)
+
+
+def test_time_is_bucketed_but_not_checked_for_drift():
+    # Two days of reference; the window only holds the last 24 one-hour buckets
+    times = np.arange(0, 172800, 60)
+    ref, _ = make_batch(times)
+    state = WindowMonitorState.from_reference(ref, ConstantModel(), ["TIME", "V1"], model_id="m",
+                                              bucket_seconds=3600, n_buckets=24)
+    assert state.drift_cols == ["V1"]
+
+    cur, hashes = make_batch(times, seed=3)
+    state.update(cur, hashes)
+    assert list(state.window_feature_summary().index) == ["V1"]
+    assert state.drifted_features() == []
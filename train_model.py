@@ -1,14 +1,21 @@
 import json
 import os
+import time
+import numpy as np
 import pandas as pd
 import snowflake.connector
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import (
     accuracy_score, precision_score, recall_score,
-    f1_score, matthews_corrcoef, confusion_matrix
+    f1_score, matthews_corrcoef, confusion_matrix, brier_score_loss
 )
 import joblib
+from cascade import (
+    fit_prefilter, calibrate_threshold, evaluate_cascade, save_cascade_config,
+    PREFILTER_MODEL_PATH, CASCADE_CONFIG_PATH
+)
+from fingerprint import StageFingerprint, table_fingerprints, file_fingerprints
 
 # Load credentials from environment variables
 account = os.getenv('SNOWFLAKE_ACCOUNT')
@@ -18,9 +25,20 @@ warehouse = os.getenv('SNOWFLAKE_WAREHOUSE')
 database = os.getenv('SNOWFLAKE_DATABASE')  # should be 'CREDITCARD'
 schema = os.getenv('SNOWFLAKE_SCHEMA')      # should be 'PUBLIC'
 
-# Function to fetch data from original table
-def fetch_data_from_snowflake():
-    conn = snowflake.connector.connect(
+# Fraction of non-fraud training rows to keep (1.0 trains on the full table)
+NEGATIVE_SAMPLING_RATE = float(os.getenv('NEGATIVE_SAMPLING_RATE', '1.0'))
+# Also fit on the full table to report speedup and metric change
+COMPARE_FULL_FIT = os.getenv('COMPARE_FULL_FIT', '0') == '1'
+
+# Train a cheap pre-filter for two-stage cascade scoring alongside the champion
+TRAIN_CASCADE = os.getenv('TRAIN_CASCADE', '1') == '1'
+# Maximum recall the cascade may lose versus the full forest on the holdout
+CASCADE_MAX_RECALL_LOSS = float(os.getenv('CASCADE_MAX_RECALL_LOSS', '0.01'))
+
+TRAINING_TABLE = "CREDITCARD.PUBLIC.CREDITCARD"
+
+def get_snowflake_connection():
+    return snowflake.connector.connect(
         user=user,
         password=password,
         account=account,
@@ -28,14 +46,72 @@ def fetch_data_from_snowflake():
         database=database,
         schema=schema
     )
+
+# Function to fetch data from original table
+def fetch_data_from_snowflake():
+    conn = get_snowflake_connection()
     cur = conn.cursor()
-    cur.execute("SELECT * FROM CREDITCARD.PUBLIC.CREDITCARD")
+    cur.execute(f"SELECT * FROM {TRAINING_TABLE}")
     df = cur.fetch_pandas_all()
     conn.close()
     return df
 
+def downsample_negatives(X, y, rate, seed=42):
+    """Keep every positive and a `rate` fraction of negatives, weighting kept negatives by 1/rate."""
+    rng = np.random.default_rng(seed)
+    is_positive = (y == 1).to_numpy()
+    keep = is_positive | (rng.random(len(y)) < rate)
+    # Reweighting restores the original class prior, so leaf probabilities stay calibrated
+    weights = np.where(is_positive[keep], 1.0, 1.0 / rate)
+    return X[keep], y[keep], weights
+
+def fit_forest(X, y, sample_weight=None):
+    rfc = RandomForestClassifier()
+    start = time.perf_counter()
+    rfc.fit(X, y, sample_weight=sample_weight)
+    return rfc, time.perf_counter() - start
+
+def evaluate_model(model, xTest, yTest):
+    yPred = model.predict(xTest)
+    return {
+        'Accuracy': accuracy_score(yTest, yPred),
+        'Precision': precision_score(yTest, yPred),
+        'Recall': recall_score(yTest, yPred),
+        'F1 Score': f1_score(yTest, yPred),
+        'Matthews Corrcoef': matthews_corrcoef(yTest, yPred),
+        # Calibration check on PREDICTION_PROB (lower is better)
+        'Brier Score': brier_score_loss(yTest, model.predict_proba(xTest)[:, 1]),
+    }
+
+
+def training_fingerprint():
+    """Training inputs: the table's warehouse-side fingerprint, the training code and its config."""
+    conn = get_snowflake_connection()
+    tables = table_fingerprints(conn, [TRAINING_TABLE])
+    conn.close()
+    inputs = {
+        "tables": tables,
+        "code": file_fingerprints(["train_model.py", "cascade.py"]),
+        "config": {
+            "NEGATIVE_SAMPLING_RATE": NEGATIVE_SAMPLING_RATE,
+            "COMPARE_FULL_FIT": COMPARE_FULL_FIT,
+            "TRAIN_CASCADE": TRAIN_CASCADE,
+            "CASCADE_MAX_RECALL_LOSS": CASCADE_MAX_RECALL_LOSS,
+        },
+    }
+    outputs = ["model.pkl", "metrics.json"]
+    if TRAIN_CASCADE:
+        outputs += [PREFILTER_MODEL_PATH, CASCADE_CONFIG_PATH]
+    return StageFingerprint("train", inputs, outputs)
+
 
 def main():
+    # Step 0: Skip training when the table, code and config match the committed model
+    fingerprint = training_fingerprint()
+    if fingerprint.unchanged():
+        fingerprint.skip()
+        return
+
     # Step 1: Load data
     data = fetch_data_from_snowflake()
     print("✅ Data loaded from Snowflake. Shape:", data.shape)
@@ -51,19 +127,51 @@ def main():
     print("✅ Data split into train and test sets.")
 
     # Step 4: Train model
-    rfc = RandomForestClassifier()
-    rfc.fit(xTrain, yTrain)
-    print("✅ Random Forest model trained.")
+    if NEGATIVE_SAMPLING_RATE < 1.0:
+        xFit, yFit, wFit = downsample_negatives(xTrain, yTrain, NEGATIVE_SAMPLING_RATE)
+        print(f"🎲 Negative downsampling at rate {NEGATIVE_SAMPLING_RATE}: {len(yFit)} of {len(yTrain)} training rows kept.")
+    else:
+        xFit, yFit, wFit = xTrain, yTrain, None
+    rfc, fit_time = fit_forest(xFit, yFit, wFit)
+    print(f"✅ Random Forest model trained in {fit_time:.1f}s.")
 
     # Step 5: Evaluate model
-    yPred = rfc.predict(xTest)
-    metrics = {
-        'Accuracy': accuracy_score(yTest, yPred),
-        'Precision': precision_score(yTest, yPred),
-        'Recall': recall_score(yTest, yPred),
-        'F1 Score': f1_score(yTest, yPred),
-        'Matthews Corrcoef': matthews_corrcoef(yTest, yPred)
-    }
+    metrics = evaluate_model(rfc, xTest, yTest)
+    metrics['Fit Time Seconds'] = fit_time
+    metrics['Training Rows'] = len(yFit)
+    metrics['Negative Sampling Rate'] = NEGATIVE_SAMPLING_RATE
+
+    if COMPARE_FULL_FIT and NEGATIVE_SAMPLING_RATE < 1.0:
+        full_rfc, full_fit_time = fit_forest(xTrain, yTrain)
+        full_metrics = evaluate_model(full_rfc, xTest, yTest)
+        metrics['Full Fit Time Seconds'] = full_fit_time
+        metrics['Fit Speedup'] = full_fit_time / fit_time
+        for metric, score in full_metrics.items():
+            metrics[f'Delta {metric}'] = metrics[metric] - score
+        print(f"⏱️ Full fit took {full_fit_time:.1f}s ({metrics['Fit Speedup']:.1f}x slower than downsampled fit).")
+
+    # Step 5b: Cascade pre-filter, threshold calibrated on one half of the holdout and checked on the other
+    if TRAIN_CASCADE:
+        prefilter = fit_prefilter(xFit, yFit, wFit)
+        xCal, xEval, yCal, yEval = train_test_split(xTest, yTest, test_size=0.5, stratify=yTest, random_state=42)
+        threshold = calibrate_threshold(
+            prefilter.predict_proba(xCal)[:, 1], yCal, rfc.predict(xCal), CASCADE_MAX_RECALL_LOSS
+        )
+        cascade_metrics = evaluate_cascade(prefilter, rfc, xEval, yEval, threshold)
+        metrics.update(cascade_metrics)
+
+        if cascade_metrics['Cascade Recall Loss'] > CASCADE_MAX_RECALL_LOSS:
+            # Don't ship a cascade that breaks its recall bound on held-out data (or leave an older one behind)
+            for path in [PREFILTER_MODEL_PATH, CASCADE_CONFIG_PATH]:
+                if os.path.exists(path):
+                    os.remove(path)
+            print(f"⚠️ Cascade recall loss {cascade_metrics['Cascade Recall Loss']:.2%} exceeds "
+                  f"{CASCADE_MAX_RECALL_LOSS:.2%} on the evaluation half; pre-filter not saved.")
+        else:
+            joblib.dump(prefilter, PREFILTER_MODEL_PATH)
+            save_cascade_config({'threshold': threshold, 'max_recall_loss': CASCADE_MAX_RECALL_LOSS, **cascade_metrics})
+            print(f"✅ Cascade pre-filter saved to {PREFILTER_MODEL_PATH} (threshold {threshold:.4f}, "
+                  f"{cascade_metrics['Cascade Escalation Rate']:.2%} of rows escalated).")
 
     print("\n📊 Model Evaluation Metrics:")
     for metric, score in metrics.items():
@@ -71,7 +179,7 @@ def main():
 
     # Confusion matrix
     print("\n📉 Confusion Matrix:")
-    print(confusion_matrix(yTest, yPred))
+    print(confusion_matrix(yTest, rfc.predict(xTest)))
 
     # Dump to JSON
     with open("metrics.json", "w") as f:
@@ -83,7 +191,7 @@ def main():
     joblib.dump(rfc, model_path)
     print(f"\n✅ Model saved to: {model_path}")
 
-    
+    fingerprint.record()
     print("\n🏁 All steps completed successfully.")
 
 if __name__ == "__main__":